@@ -8,6 +8,7 @@ from alembic import context
 # Import your Base metadata
 from app.db.base import Base
 from app.core.config import settings 
+from app.db.partitions import CHAT_PARTITION_PREFIX
 
 config = context.config
 config.set_main_option(
@@ -21,12 +22,20 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 
 
+def include_name(name, type_, parent_names):
+    """Skip chat message partitions, they are created at runtime rather than declared in the models"""
+    if type_ == "table":
+        return not name.startswith(CHAT_PARTITION_PREFIX)
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode."""
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -39,6 +48,7 @@ def do_run_migrations(connection):
     context.configure(
         connection=connection,
         target_metadata=target_metadata,
+        include_name=include_name,
     )
 
     with context.begin_transaction():
@@ -0,0 +1,44 @@
+"""Add unique photo like
+
+Revision ID: 057e3f757b8c
+Revises: d25006241e36
+Create Date: 2026-10-15 22:25:35.267986
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '057e3f757b8c'
+down_revision: Union[str, None] = 'd25006241e36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Drop duplicate likes (keep the first) and recount the affected photos;
+    # the UPDATE still sees the deleted rows, hence counting distinct users
+    op.execute("""
+        WITH removed AS (
+            DELETE FROM photo_likes
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, row_number() OVER (PARTITION BY photo_id, user_id ORDER BY id) AS rn
+                    FROM photo_likes
+                ) ranked
+                WHERE rn > 1
+            )
+            RETURNING photo_id
+        )
+        UPDATE photos
+        SET likes_count = (SELECT count(DISTINCT user_id) FROM photo_likes WHERE photo_likes.photo_id = photos.id)
+        WHERE id IN (SELECT photo_id FROM removed)
+    """)
+    op.create_unique_constraint('unique_photo_like', 'photo_likes', ['photo_id', 'user_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('unique_photo_like', 'photo_likes', type_='unique')
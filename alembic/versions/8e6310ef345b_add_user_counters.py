@@ -0,0 +1,38 @@
+"""Add user counters
+
+Revision ID: 8e6310ef345b
+Revises: 6674bc28b5ba
+Create Date: 2026-10-15 22:51:40.336591
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e6310ef345b'
+down_revision: Union[str, None] = '6674bc28b5ba'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('followers_count', sa.Integer(), nullable=True))
+    op.add_column('users', sa.Column('following_count', sa.Integer(), nullable=True))
+    op.add_column('users', sa.Column('photos_count', sa.Integer(), nullable=True))
+    
+    # Backfill from the current follows and photos
+    op.execute("""
+        UPDATE users
+        SET followers_count = (SELECT count(*) FROM follows WHERE follows.followed_id = users.id),
+            following_count = (SELECT count(*) FROM follows WHERE follows.follower_id = users.id),
+            photos_count = (SELECT count(*) FROM photos WHERE photos.owner_id = users.id)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'photos_count')
+    op.drop_column('users', 'following_count')
+    op.drop_column('users', 'followers_count')
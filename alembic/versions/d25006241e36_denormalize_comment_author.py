@@ -0,0 +1,63 @@
+"""Denormalize comment author
+
+Revision ID: d25006241e36
+Revises: 78a90a44804e
+Create Date: 2026-10-15 22:20:55.210825
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd25006241e36'
+down_revision: Union[str, None] = '78a90a44804e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('comments', sa.Column('author_username', sa.String(length=50), nullable=True))
+    op.add_column('comments', sa.Column('author_profile_picture', sa.String(length=500), nullable=True))
+    op.create_index(op.f('ix_comments_author_id'), 'comments', ['author_id'], unique=False)
+    
+    # Backfill from users, then require the username
+    op.execute("""
+        UPDATE comments
+        SET author_username = users.username,
+            author_profile_picture = users.profile_picture
+        FROM users
+        WHERE users.id = comments.author_id
+    """)
+    op.alter_column('comments', 'author_username', nullable=False)
+    
+    # Keep the copies in step when a user renames or changes their picture
+    op.execute("""
+        CREATE FUNCTION sync_comment_author() RETURNS trigger AS $$
+        BEGIN
+            UPDATE comments
+            SET author_username = NEW.username,
+                author_profile_picture = NEW.profile_picture
+            WHERE author_id = NEW.id;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER users_sync_comment_author
+        AFTER UPDATE OF username, profile_picture ON users
+        FOR EACH ROW
+        WHEN (OLD.username IS DISTINCT FROM NEW.username
+              OR OLD.profile_picture IS DISTINCT FROM NEW.profile_picture)
+        EXECUTE FUNCTION sync_comment_author()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER users_sync_comment_author ON users")
+    op.execute("DROP FUNCTION sync_comment_author()")
+    op.drop_index(op.f('ix_comments_author_id'), table_name='comments')
+    op.drop_column('comments', 'author_profile_picture')
+    op.drop_column('comments', 'author_username')
@@ -0,0 +1,94 @@
+"""Partition chat messages by month
+
+Revision ID: f895fd45153b
+Revises: 649b1b197d8a
+Create Date: 2026-10-15 23:07:28.894662
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f895fd45153b'
+down_revision: Union[str, None] = '649b1b197d8a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, content, sender_id, receiver_id, is_read, is_deleted_by_sender, is_deleted_by_receiver, created_at, read_at"
+
+
+def create_chat_messages_table(partitioned: bool) -> None:
+    """Create chat_messages, range partitioned on created_at or as a plain table"""
+    op.create_table('chat_messages',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('chat_messages_id_seq'::regclass)"), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('sender_id', sa.Integer(), nullable=False),
+    sa.Column('receiver_id', sa.Integer(), nullable=False),
+    sa.Column('is_read', sa.Boolean(), nullable=True),
+    sa.Column('is_deleted_by_sender', sa.Boolean(), nullable=True),
+    sa.Column('is_deleted_by_receiver', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=not partitioned),
+    sa.Column('read_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['receiver_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'created_at') if partitioned else sa.PrimaryKeyConstraint('id'),
+    **({'postgresql_partition_by': 'RANGE (created_at)'} if partitioned else {})
+    )
+
+
+def create_chat_messages_indexes() -> None:
+    """Create the chat_messages indexes (on a partitioned table they cascade to the partitions)"""
+    op.create_index(op.f('ix_chat_messages_created_at'), 'chat_messages', ['created_at'], unique=False)
+    op.create_index(op.f('ix_chat_messages_id'), 'chat_messages', ['id'], unique=False)
+    op.create_index(op.f('ix_chat_messages_receiver_id'), 'chat_messages', ['receiver_id'], unique=False)
+    op.create_index(op.f('ix_chat_messages_sender_id'), 'chat_messages', ['sender_id'], unique=False)
+    op.create_index('ix_chat_messages_sender_receiver_created', 'chat_messages', ['sender_id', 'receiver_id', sa.text('created_at DESC')], unique=False)
+    op.create_index('ix_chat_messages_conversation_created', 'chat_messages', [sa.text('least(sender_id, receiver_id)'), sa.text('greatest(sender_id, receiver_id)'), sa.text('created_at DESC'), sa.text('id DESC')], unique=False)
+
+
+def replace_chat_messages_table(partitioned: bool) -> None:
+    """Move chat_messages rows into a new table, keeping the id sequence"""
+    op.execute("ALTER SEQUENCE chat_messages_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE chat_messages RENAME TO chat_messages_old")
+    op.execute("ALTER INDEX chat_messages_pkey RENAME TO chat_messages_old_pkey")
+    create_chat_messages_table(partitioned)
+    
+    if partitioned:
+        # Monthly partitions (UTC) from the oldest message through next month,
+        # and a default partition so inserts never fail for a missing month
+        op.execute("""
+            DO $$
+            DECLARE
+                month timestamp := date_trunc('month', coalesce((SELECT min(created_at) FROM chat_messages_old), now()) AT TIME ZONE 'UTC');
+            BEGIN
+                WHILE month <= date_trunc('month', now() AT TIME ZONE 'UTC') + interval '1 month' LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF chat_messages FOR VALUES FROM (%L) TO (%L)',
+                        'chat_messages_' || to_char(month, 'YYYY_MM'),
+                        month AT TIME ZONE 'UTC',
+                        (month + interval '1 month') AT TIME ZONE 'UTC'
+                    );
+                    month := month + interval '1 month';
+                END LOOP;
+            END
+            $$
+        """)
+        op.execute("CREATE TABLE chat_messages_default PARTITION OF chat_messages DEFAULT")
+        op.execute(f"INSERT INTO chat_messages ({COLUMNS}) SELECT {COLUMNS.replace('created_at', 'coalesce(created_at, now())')} FROM chat_messages_old")
+    else:
+        op.execute(f"INSERT INTO chat_messages ({COLUMNS}) SELECT {COLUMNS} FROM chat_messages_old")
+    
+    op.drop_table('chat_messages_old')
+    op.execute("ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id")
+    create_chat_messages_indexes()
+
+
+def upgrade() -> None:
+    replace_chat_messages_table(partitioned=True)
+
+
+def downgrade() -> None:
+    replace_chat_messages_table(partitioned=False)
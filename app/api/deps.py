@@ -1,26 +1,80 @@
+import asyncio
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import Optional
+from sqlalchemy import select, bindparam
+from sqlalchemy.orm import make_transient_to_detached
+from cachetools import TTLCache
+from types import MappingProxyType
+from typing import Optional, Mapping, Dict, Any
 
 from app.db.session import get_db
 from app.models.user import User
-from app.core.security import decode_token
+from app.core.security import decode_token_async, token_fingerprint
 from app.services.cache_service import check_rate_limit
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
+# Columns kept in a cached user snapshot (everything read off current_user)
+_SNAPSHOT_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    User.bio,
+    User.profile_picture,
+    User.profile_picture_sizes,
+    User.is_active,
+    User.is_verified,
+    User.is_oauth,
+    User.oauth_provider,
+    User.created_at,
+    User.updated_at,
+)
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """Get current authenticated user from JWT token"""
-    token = credentials.credentials
+# Built once so each lookup skips statement construction and cache-key work
+GET_USER_SNAPSHOT = select(*_SNAPSHOT_COLUMNS).where(User.id == bindparam("uid"))
+
+# Recently loaded users keyed by id
+_USER_CACHE: TTLCache = TTLCache(maxsize=50000, ttl=30)
+
+# Token lookups currently in progress, keyed by token fingerprint
+_INFLIGHT: Dict[bytes, asyncio.Future] = {}
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    """Drop a user's cached snapshot so the next request reloads it"""
+    _USER_CACHE.pop(user_id, None)
+
+
+async def get_user_snapshot(db: AsyncSession, user_id: int) -> Optional[Mapping[str, Any]]:
+    """Get user columns by ID, served from the in-process cache when fresh"""
+    snapshot = _USER_CACHE.get(user_id)
+    if snapshot is None:
+        result = await db.execute(GET_USER_SNAPSHOT, {"uid": user_id})
+        row = result.mappings().one_or_none()
+        if row is None:
+            return None
+        snapshot = MappingProxyType(dict(row))
+        _USER_CACHE[user_id] = snapshot
+    return snapshot
+
+
+def user_from_snapshot(snapshot: Mapping[str, Any]) -> User:
+    """
+    Build a detached User from a snapshot
+    Endpoints that modify the user must merge it into their session first
+    """
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return user
+
+
+async def _resolve_token_user(token: str, db: AsyncSession) -> Mapping[str, Any]:
+    """Decode an access token and load its user snapshot"""
     
     # Decode token
-    payload = decode_token(token)
+    payload = await decode_token_async(token)
     if not payload:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -35,38 +89,67 @@ async def get_current_user(
         )
     
     # Get user from database
-    user_id = payload.get("sub")
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload"
-        )
-    
-    # Convert user_id to int if it's a string (from JWT)
-    try:
-        user_id = int(user_id)
-    except (ValueError, TypeError):
+    user_id = payload.get("uid")
+    if not isinstance(user_id, int):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token payload"
         )
     
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    snapshot = await get_user_snapshot(db, user_id)
     
-    if not user:
+    if not snapshot:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
-    if not user.is_active:
+    if not snapshot["is_active"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User account is inactive"
         )
     
-    return user
+    return snapshot
+
+
+async def authenticate_token(token: str, db: AsyncSession) -> Mapping[str, Any]:
+    """
+    Resolve a token to its user snapshot
+    Concurrent calls with the same token share a single lookup
+    """
+    key = token_fingerprint(token)
+    
+    inflight = _INFLIGHT.get(key)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+    
+    future = asyncio.get_running_loop().create_future()
+    # Avoid "exception was never retrieved" warnings when nobody is waiting
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _INFLIGHT[key] = future
+    try:
+        snapshot = await _resolve_token_user(token, db)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(snapshot)
+        return snapshot
+    finally:
+        _INFLIGHT.pop(key, None)
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Get current authenticated user from JWT token"""
+    snapshot = await authenticate_token(credentials.credentials, db)
+    return user_from_snapshot(snapshot)
 
 
 async def get_current_verified_user(
@@ -82,7 +165,7 @@ async def get_current_verified_user(
 
 
 async def get_optional_current_user(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
     db: AsyncSession = Depends(get_db)
 ) -> Optional[User]:
     """Get current user if authenticated, otherwise return None"""
@@ -90,30 +173,11 @@ async def get_optional_current_user(
         return None
     
     try:
-        token = credentials.credentials
-        payload = decode_token(token)
-        if not payload or payload.get("type") != "access":
-            return None
-        
-        user_id = payload.get("sub")
-        if not user_id:
-            return None
-        
-        # Convert user_id to int if it's a string (from JWT)
-        try:
-            user_id = int(user_id)
-        except (ValueError, TypeError):
-            return None
-        
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-        
-        if user and user.is_active:
-            return user
-    except:
-        pass
+        snapshot = await authenticate_token(credentials.credentials, db)
+    except Exception:
+        return None
     
-    return None
+    return user_from_snapshot(snapshot)
 
 
 async def rate_limit_check(
@@ -121,10 +185,15 @@ async def rate_limit_check(
 ):
     """Rate limiting middleware"""
     token = credentials.credentials
-    payload = decode_token(token)
+    payload = await decode_token_async(token)
     
     if payload:
-        user_id = payload.get("sub")
+        user_id = payload.get("uid")
+        if not isinstance(user_id, int):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token payload"
+            )
         key = f"rate_limit:user:{user_id}"
         
         if not await check_rate_limit(key, limit=60, window=60):
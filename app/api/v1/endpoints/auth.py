@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, or_
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
+import secrets
 from authlib.integrations.starlette_client import OAuth
 from starlette.requests import Request
 
@@ -10,13 +12,16 @@ from app.db.session import get_db
 from app.models.user import User, EmailVerification, PasswordReset
 from app.schemas.user import UserRegister, UserResponse, EmailVerificationRequest, ResendVerificationRequest, UserLogin, ForgotPasswordRequest, ResetPasswordRequest
 from app.schemas.token import LoginResponse, RefreshTokenRequest
-from app.core.security import hash_password, verify_password, create_access_token, create_refresh_token, decode_token, generate_verification_code, generate_verification_token
+from app.core.security import hash_password_async, verify_password_async, create_access_token, create_refresh_token, decode_token_async, generate_verification_code, verification_code_matches, generate_verification_token
 from app.core.config import settings
 from app.tasks.email_tasks import send_verification_email, send_welcome_email, send_password_reset_email
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, invalidate_cached_user
 
 router = APIRouter()
 
+# Usernames probed at once when deriving one for a new Google account
+USERNAME_CANDIDATES = 32
+
 # OAuth setup
 oauth = OAuth()
 oauth.register(
@@ -28,6 +33,15 @@ oauth.register(
 )
 
 
+async def load_google_metadata():
+    """Fetch Google's OpenID metadata ahead of the first OAuth request"""
+    try:
+        await oauth.google.load_server_metadata()
+    except Exception:
+        # Not fatal, authlib fetches it again on first use
+        pass
+
+
 @router.get("/test-auth")
 async def test_auth(current_user: User = Depends(get_current_user)):
     """Test endpoint to verify authentication is working"""
@@ -47,17 +61,19 @@ async def register(
 ):
     """Register a new user and send verification email"""
     
-    # Check if email already exists
-    result = await db.execute(select(User).where(User.email == user_data.email))
-    if result.scalar_one_or_none():
+    # Check if email or username already exists
+    result = await db.execute(
+        select(User.email, User.username).where(
+            or_(User.email == user_data.email, User.username == user_data.username)
+        )
+    )
+    existing = result.all()
+    if any(row.email == user_data.email for row in existing):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
-    
-    # Check if username already exists
-    result = await db.execute(select(User).where(User.username == user_data.username))
-    if result.scalar_one_or_none():
+    if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
@@ -67,11 +83,19 @@ async def register(
     user = User(
         username=user_data.username,
         email=user_data.email,
-        hashed_password=hash_password(user_data.password),
+        hashed_password=await hash_password_async(user_data.password),
         is_verified=False
     )
     db.add(user)
-    await db.flush()
+    try:
+        await db.flush()
+    except IntegrityError:
+        # Lost a race with a concurrent registration
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email or username already registered"
+        )
     
     # Generate verification code
     code = generate_verification_code()
@@ -100,17 +124,20 @@ async def verify_email(
 ):
     """Verify email with 6-digit code"""
     
-    # Find verification record
+    # Find the address's active codes (partial index on unused rows) and
+    # pick the matching one, compared in constant time
     result = await db.execute(
         select(EmailVerification)
         .where(
             EmailVerification.email == verification_data.email,
-            EmailVerification.code == verification_data.code,
             EmailVerification.is_used == False,
             EmailVerification.expires_at > datetime.utcnow()
         )
     )
-    verification = result.scalar_one_or_none()
+    verification = next(
+        (v for v in result.scalars() if verification_code_matches(v.code, verification_data.code)),
+        None
+    )
     
     if not verification:
         raise HTTPException(
@@ -119,8 +146,7 @@ async def verify_email(
         )
     
     # Get user
-    result = await db.execute(select(User).where(User.id == verification.user_id))
-    user = result.scalar_one_or_none()
+    user = await db.get(User, verification.user_id)
     
     if not user:
         raise HTTPException(
@@ -132,6 +158,7 @@ async def verify_email(
     user.is_verified = True
     verification.is_used = True
     await db.commit()
+    invalidate_cached_user(user.id)
     
     # Send welcome email
     send_welcome_email.delay(user.email, user.username)
@@ -150,8 +177,10 @@ async def resend_verification(
     """Resend verification code"""
     
     # Get user
-    result = await db.execute(select(User).where(User.email == data.email))
-    user = result.scalar_one_or_none()
+    result = await db.execute(
+        select(User.id, User.email, User.username, User.is_verified).where(User.email == data.email)
+    )
+    user = result.one_or_none()
     
     if not user:
         raise HTTPException(
@@ -167,8 +196,9 @@ async def resend_verification(
     
     # Mark old verifications as used
     await db.execute(
-        select(EmailVerification)
-        .where(EmailVerification.email == data.email)
+        update(EmailVerification)
+        .where(EmailVerification.email == data.email, EmailVerification.is_used == False)
+        .values(is_used=True)
     )
     
     # Generate new code
@@ -206,7 +236,8 @@ async def login(
         )
     
     # Verify password
-    if not verify_password(login_data.password, user.hashed_password):
+    valid, new_hash = await verify_password_async(login_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
@@ -218,6 +249,14 @@ async def login(
             detail="Account is inactive"
         )
     
+    # Upgrade hashes made with older Argon2 parameters or without the pepper
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    
+    # Start the new session from fresh user state
+    invalidate_cached_user(user.id)
+    
     # Create tokens
     access_token = create_access_token({"sub": user.id})
     refresh_token = create_refresh_token({"sub": user.id})
@@ -236,7 +275,7 @@ async def refresh_token(
 ):
     """Refresh access token using refresh token"""
     
-    payload = decode_token(token_data.refresh_token)
+    payload = await decode_token_async(token_data.refresh_token)
     
     if not payload or payload.get("type") != "refresh":
         raise HTTPException(
@@ -244,29 +283,24 @@ async def refresh_token(
             detail="Invalid refresh token"
         )
     
-    user_id = payload.get("sub")
-    
-    # Convert user_id to int if it's a string (from JWT)
-    try:
-        user_id = int(user_id)
-    except (ValueError, TypeError):
+    user_id = payload.get("uid")
+    if not isinstance(user_id, int):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token payload"
         )
     
-    # Verify user exists
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    # Verify user exists and is active
+    is_active = await db.scalar(select(User.is_active).where(User.id == user_id))
     
-    if not user or not user.is_active:
+    if not is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid user"
         )
     
     # Create new access token
-    access_token = create_access_token({"sub": user.id})
+    access_token = create_access_token({"sub": user_id})
     
     return {
         "access_token": access_token,
@@ -282,8 +316,10 @@ async def forgot_password(
     """Request password reset"""
     
     # Get user
-    result = await db.execute(select(User).where(User.email == data.email))
-    user = result.scalar_one_or_none()
+    result = await db.execute(
+        select(User.id, User.email, User.username).where(User.email == data.email)
+    )
+    user = result.one_or_none()
     
     # Always return success to prevent email enumeration
     if not user:
@@ -332,8 +368,7 @@ async def reset_password(
         )
     
     # Get user
-    result = await db.execute(select(User).where(User.id == reset.user_id))
-    user = result.scalar_one_or_none()
+    user = await db.get(User, reset.user_id)
     
     if not user:
         raise HTTPException(
@@ -342,9 +377,10 @@ async def reset_password(
         )
     
     # Update password
-    user.hashed_password = hash_password(data.new_password)
+    user.hashed_password = await hash_password_async(data.new_password)
     reset.is_used = True
     await db.commit()
+    invalidate_cached_user(user.id)
     
     return {"message": "Password reset successful"}
 
@@ -382,16 +418,14 @@ async def google_callback(
         
         if not user:
             # Create new user
-            # Generate unique username
+            # Generate unique username from a batch of candidates
             base_username = name.lower().replace(' ', '_')
-            username = base_username
-            counter = 1
-            while True:
-                result = await db.execute(select(User).where(User.username == username))
-                if not result.scalar_one_or_none():
-                    break
-                username = f"{base_username}{counter}"
-                counter += 1
+            candidates = [base_username] + [f"{base_username}{i}" for i in range(1, USERNAME_CANDIDATES)]
+            result = await db.execute(select(User.username).where(User.username.in_(candidates)))
+            taken = set(result.scalars())
+            username = next((c for c in candidates if c not in taken), None)
+            if username is None:
+                username = f"{base_username}_{secrets.token_hex(4)}"
             
             user = User(
                 username=username,
@@ -402,7 +436,6 @@ async def google_callback(
             )
             db.add(user)
             await db.commit()
-            await db.refresh(user)
         
         # Create tokens
         access_token = create_access_token({"sub": user.id})
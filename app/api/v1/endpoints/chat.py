@@ -1,21 +1,168 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, status, Request, WebSocket, WebSocketDisconnect
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func
-from typing import Dict, List
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, update, and_, func, case, tuple_, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import List, Optional, Dict, Tuple, Any
+from pydantic import TypeAdapter, ValidationError
 from datetime import datetime
+import asyncio
+import msgspec
 
 from app.db.session import get_db, AsyncSessionLocal
 from app.models.user import User
-from app.models.chat import ChatMessage
-from app.schemas.chat import MessageCreate, MessageResponse, ConversationResponse
+from app.models.chat import ChatMessage, ConversationState
+from app.schemas.chat import (
+    MessageCreate, MessageResponse, MessageEntry, ConversationResponse, ConversationEntry,
+    WSMessage, WSChatMessage, WSTyping, WSRead
+)
 from app.api.deps import get_current_verified_user
-from app.core.security import decode_token
+from app.core.security import decode_token_async
 from app.services.cache_service import set_user_online, is_user_online
+from app.services.chat_service import add_connection, remove_connection, send_to_user, send_json
+from app.utils.http import json_response
 
 router = APIRouter()
 
-# Store active WebSocket connections
-active_connections: Dict[int, WebSocket] = {}
+# Chat messages committed together per socket, and how long a batch may wait
+WS_BATCH_SIZE = 8
+WS_BATCH_DELAY = 0.005
+
+# What sending on a socket the client has already closed raises
+# (uvicorn's ClientDisconnected is an OSError, Starlette raises RuntimeError)
+SOCKET_CLOSED_ERRORS = (WebSocketDisconnect, OSError, RuntimeError)
+
+# Encoder for conversation and message lists, reused across requests
+chat_list_encoder = msgspec.json.Encoder()
+
+# Parses and validates inbound WebSocket frames in one pass
+ws_message_adapter = TypeAdapter(WSMessage)
+
+# Columns returned for each message of a chat history
+_MESSAGE_COLUMNS = (
+    ChatMessage.id,
+    ChatMessage.content,
+    ChatMessage.sender_id,
+    ChatMessage.receiver_id,
+    ChatMessage.is_read,
+    ChatMessage.created_at,
+    ChatMessage.read_at,
+)
+
+# Message lookup for WebSocket read receipts, built once at import
+GET_RECEIVED_MESSAGE = select(ChatMessage).where(
+    ChatMessage.id == bindparam("message_id"),
+    ChatMessage.receiver_id == bindparam("receiver_id")
+)
+
+# Fold new messages into both participants' conversation states, keeping
+# the latest message when batches commit out of order
+_state_insert = pg_insert(ConversationState)
+_newer_message = tuple_(_state_insert.excluded.last_activity, _state_insert.excluded.last_message_id) > tuple_(
+    ConversationState.last_activity, ConversationState.last_message_id
+)
+UPSERT_CONVERSATION_STATE = _state_insert.on_conflict_do_update(
+    index_elements=[ConversationState.user_id, ConversationState.peer_id],
+    set_={
+        "unread_count": ConversationState.unread_count + _state_insert.excluded.unread_count,
+        "last_message_id": case(
+            (_newer_message, _state_insert.excluded.last_message_id),
+            else_=ConversationState.last_message_id
+        ),
+        "last_activity": case(
+            (_newer_message, _state_insert.excluded.last_activity),
+            else_=ConversationState.last_activity
+        ),
+    }
+)
+
+# Take messages the user just read off their unread count
+DECREMENT_UNREAD_COUNT = (
+    update(ConversationState)
+    .where(
+        ConversationState.user_id == bindparam("uid"),
+        ConversationState.peer_id == bindparam("peer")
+    )
+    .values(unread_count=func.greatest(ConversationState.unread_count - bindparam("read"), 0))
+)
+
+# A user's conversations with the latest message and the other user's
+# profile, newest first (the message join prunes to a single partition)
+GET_CONVERSATIONS = (
+    select(
+        ConversationState.peer_id,
+        ConversationState.unread_count,
+        ConversationState.last_activity,
+        ChatMessage.content,
+        User.username,
+        User.profile_picture
+    )
+    .join(
+        ChatMessage,
+        and_(
+            ChatMessage.id == ConversationState.last_message_id,
+            ChatMessage.created_at == ConversationState.last_activity
+        )
+    )
+    .join(User, User.id == ConversationState.peer_id)
+    .where(ConversationState.user_id == bindparam("uid"))
+    .order_by(ConversationState.last_activity.desc(), ConversationState.last_message_id.desc())
+)
+
+
+async def store_messages_individually(db: AsyncSession, messages: List[ChatMessage]) -> Tuple[List[ChatMessage], List[ChatMessage]]:
+    """
+    Commit messages one savepoint each, after a batch insert failed
+    Returns the stored messages and the ones whose receiver doesn't exist
+    """
+    stored, rejected = [], []
+    for message in messages:
+        # Fresh instances, the rolled back ones may carry flush state
+        message = ChatMessage(
+            content=message.content,
+            sender_id=message.sender_id,
+            receiver_id=message.receiver_id
+        )
+        try:
+            async with db.begin_nested():
+                db.add(message)
+                await db.flush()
+        except IntegrityError:
+            rejected.append(message)
+        else:
+            stored.append(message)
+    
+    if stored:
+        await record_conversation_activity(db, stored)
+    await db.commit()
+    return stored, rejected
+
+
+async def record_conversation_activity(db: AsyncSession, messages: List[ChatMessage]):
+    """Update the conversation states for messages flushed in this transaction"""
+    states: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for message in messages:
+        # The sender's side only moves forward, the receiver's also gains an unread message
+        for user_id, peer_id, unread in (
+            (message.sender_id, message.receiver_id, 0),
+            (message.receiver_id, message.sender_id, 1),
+        ):
+            state = states.get((user_id, peer_id))
+            if state is None:
+                state = states[(user_id, peer_id)] = {
+                    "user_id": user_id,
+                    "peer_id": peer_id,
+                    "unread_count": 0,
+                    "last_message_id": message.id,
+                    "last_activity": message.created_at,
+                }
+            elif (message.created_at, message.id) > (state["last_activity"], state["last_message_id"]):
+                state["last_message_id"] = message.id
+                state["last_activity"] = message.created_at
+            state["unread_count"] += unread
+    
+    # Upsert in key order so concurrent senders lock rows in the same order
+    await db.execute(UPSERT_CONVERSATION_STATE, [states[key] for key in sorted(states)])
 
 
 @router.websocket("/ws")
@@ -23,179 +170,221 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
     """WebSocket endpoint for real-time chat"""
     
     # Verify token
-    payload = decode_token(token)
+    payload = await decode_token_async(token)
     if not payload or payload.get("type") != "access":
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
-    user_id = payload.get("sub")
-    if not user_id:
+    user_id = payload.get("uid")
+    if not isinstance(user_id, int):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
     # Accept connection
     await websocket.accept()
-    active_connections[user_id] = websocket
+    add_connection(user_id, websocket)
     await set_user_online(user_id)
     
     try:
         async with AsyncSessionLocal() as db:
-            while True:
-                # Receive message
-                data = await websocket.receive_json()
-                
-                message_type = data.get("type")
-                
-                if message_type == "message":
-                    # Send message
-                    receiver_id = data.get("receiver_id")
-                    content = data.get("content")
-                    
-                    if not receiver_id or not content:
-                        continue
-                    
-                    # Check if users are not blocked
-                    # (Add block check logic here)
-                    
-                    # Save message to database
-                    message = ChatMessage(
-                        content=content,
-                        sender_id=user_id,
-                        receiver_id=receiver_id
-                    )
-                    db.add(message)
-                    await db.commit()
-                    await db.refresh(message)
+            # Messages waiting to be committed, and a lock so the delayed
+            # flush and the receive loop never use the session at once
+            pending: List[ChatMessage] = []
+            db_lock = asyncio.Lock()
+            flush_task = None
+            
+            async def flush_pending(confirm: bool = True):
+                """Commit pending messages in one transaction and deliver them"""
+                async with db_lock:
+                    if not pending:
+                        return
+                    batch = pending[:]
+                    rejected: List[ChatMessage] = []
+                    try:
+                        db.add_all(batch)
+                        await db.flush()
+                        await record_conversation_activity(db, batch)
+                        await db.commit()
+                    except IntegrityError:
+                        # A receiver that doesn't exist fails the whole batch,
+                        # keep the valid messages and reject the others
+                        await db.rollback()
+                        try:
+                            stored, rejected = await store_messages_individually(db, batch)
+                        except Exception:
+                            await db.rollback()
+                            raise
+                    except Exception:
+                        # Leave the batch pending, the session usable, and the
+                        # error to the caller
+                        await db.rollback()
+                        raise
+                    else:
+                        stored = batch
+                    # Messages appended meanwhile stay queued
+                    del pending[:len(batch)]
                     
-                    # Send to receiver if online
-                    if receiver_id in active_connections:
-                        receiver_ws = active_connections[receiver_id]
-                        await receiver_ws.send_json({
+                    for message in stored:
+                        # Send to receiver's connected devices
+                        await send_to_user(message.receiver_id, {
                             "type": "message",
                             "id": message.id,
-                            "content": content,
+                            "content": message.content,
                             "sender_id": user_id,
                             "created_at": message.created_at.isoformat()
                         })
+                        
+                        # Confirm to sender
+                        if confirm:
+                            await send_json(websocket, {
+                                "type": "sent",
+                                "id": message.id,
+                                "receiver_id": message.receiver_id
+                            })
+                    
+                    # Tell the sender which messages were not stored
+                    if confirm:
+                        for message in rejected:
+                            await send_json(websocket, {
+                                "type": "error",
+                                "detail": "Receiver not found",
+                                "receiver_id": message.receiver_id
+                            })
+            
+            async def flush_later():
+                """Flush the batch once the batching window has passed"""
+                nonlocal flush_task
+                await asyncio.sleep(WS_BATCH_DELAY)
+                # Messages queued from now on start a new timer
+                flush_task = None
+                try:
+                    await flush_pending()
+                except SOCKET_CLOSED_ERRORS:
+                    # Socket closed meanwhile, the receive loop cleans up
+                    pass
+                except Exception:
+                    # Messages could not be stored, close the socket as a failed
+                    # inline flush would (the final flush retries them)
+                    await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+                    raise
+            
+            try:
+                while True:
+                    # Receive message, skipping frames that match no message type
+                    try:
+                        frame = ws_message_adapter.validate_json(await websocket.receive_text())
+                    except ValidationError:
+                        continue
+                    
+                    if isinstance(frame, WSChatMessage):
+                        # Send message
+                        # Check if users are not blocked
+                        # (Add block check logic here)
+                        
+                        # Queue message for the next batch commit
+                        pending.append(ChatMessage(
+                            content=frame.content,
+                            sender_id=user_id,
+                            receiver_id=frame.receiver_id
+                        ))
+                        if len(pending) >= WS_BATCH_SIZE:
+                            # The full batch goes now, the timer has nothing left to do
+                            if flush_task is not None:
+                                flush_task.cancel()
+                                flush_task = None
+                            await flush_pending()
+                        elif flush_task is None:
+                            flush_task = asyncio.create_task(flush_later())
                     
-                    # Confirm to sender
-                    await websocket.send_json({
-                        "type": "sent",
-                        "id": message.id,
-                        "receiver_id": receiver_id
-                    })
-                
-                elif message_type == "typing":
-                    # Notify typing status
-                    receiver_id = data.get("receiver_id")
-                    if receiver_id and receiver_id in active_connections:
-                        receiver_ws = active_connections[receiver_id]
-                        await receiver_ws.send_json({
+                    elif isinstance(frame, WSTyping):
+                        # Notify typing status
+                        await send_to_user(frame.receiver_id, {
                             "type": "typing",
                             "sender_id": user_id
                         })
-                
-                elif message_type == "read":
-                    # Mark message as read
-                    message_id = data.get("message_id")
-                    if message_id:
-                        result = await db.execute(
-                            select(ChatMessage).where(
-                                and_(
-                                    ChatMessage.id == message_id,
-                                    ChatMessage.receiver_id == user_id
-                                )
+                    
+                    elif isinstance(frame, WSRead):
+                        # Mark message as read
+                        message_id = frame.message_id
+                        async with db_lock:
+                            result = await db.execute(
+                                GET_RECEIVED_MESSAGE,
+                                {"message_id": message_id, "receiver_id": user_id}
                             )
-                        )
-                        message = result.scalar_one_or_none()
+                            message = result.scalar_one_or_none()
+                            if message and not message.is_read:
+                                message.is_read = True
+                                message.read_at = datetime.utcnow()
+                                await db.execute(
+                                    DECREMENT_UNREAD_COUNT,
+                                    {"uid": user_id, "peer": message.sender_id, "read": 1}
+                                )
+                                await db.commit()
+                        
+                        # Notify sender
                         if message:
-                            message.is_read = True
-                            message.read_at = datetime.utcnow()
-                            await db.commit()
-                            
-                            # Notify sender
-                            if message.sender_id in active_connections:
-                                sender_ws = active_connections[message.sender_id]
-                                await sender_ws.send_json({
-                                    "type": "read",
-                                    "message_id": message_id
-                                })
+                            await send_to_user(message.sender_id, {
+                                "type": "read",
+                                "message_id": message_id
+                            })
+            finally:
+                # Persist messages still waiting when the socket goes away
+                if flush_task is not None:
+                    flush_task.cancel()
+                await flush_pending(confirm=False)
     
     except WebSocketDisconnect:
         pass
     finally:
         # Remove connection
-        if user_id in active_connections:
-            del active_connections[user_id]
+        remove_connection(user_id, websocket)
 
 
 @router.get("/conversations", response_model=List[ConversationResponse])
 async def get_conversations(
+    request: Request,
     current_user: User = Depends(get_current_verified_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get list of conversations with latest message"""
     
-    # Get all users the current user has chatted with
-    result = await db.execute(
-        select(ChatMessage)
-        .where(
-            or_(
-                ChatMessage.sender_id == current_user.id,
-                ChatMessage.receiver_id == current_user.id
-            )
-        )
-        .order_by(ChatMessage.created_at.desc())
-    )
-    messages = result.scalars().all()
+    # Read from the per-user conversation states (streamed from a
+    # server-side cursor rather than buffered all at once)
+    result = await db.stream(GET_CONVERSATIONS, {"uid": current_user.id})
     
-    # Build conversations map
-    conversations = {}
-    for message in messages:
-        other_user_id = message.receiver_id if message.sender_id == current_user.id else message.sender_id
-        
-        if other_user_id not in conversations:
-            # Get unread count
-            unread_count = await db.scalar(
-                select(func.count()).select_from(ChatMessage).where(
-                    and_(
-                        ChatMessage.sender_id == other_user_id,
-                        ChatMessage.receiver_id == current_user.id,
-                        ChatMessage.is_read == False
-                    )
-                )
-            )
-            
-            # Get other user info
-            user_result = await db.execute(select(User).where(User.id == other_user_id))
-            other_user = user_result.scalar_one_or_none()
-            
-            if other_user:
-                conversations[other_user_id] = ConversationResponse(
-                    user_id=other_user.id,
-                    username=other_user.username,
-                    profile_picture=other_user.profile_picture,
-                    last_message=message.content[:50],
-                    last_message_time=message.created_at,
-                    unread_count=unread_count or 0
-                )
+    conversations = []
+    async for rows in result.partitions(500):
+        for row in rows:
+            conversations.append(ConversationEntry(
+                user_id=row.peer_id,
+                username=row.username,
+                profile_picture=row.profile_picture,
+                last_message=row.content[:50],
+                last_message_time=row.last_activity,
+                unread_count=row.unread_count
+            ))
     
-    return list(conversations.values())
+    return json_response(request, chat_list_encoder.encode(conversations))
 
 
 @router.get("/messages/{other_user_id}", response_model=List[MessageResponse])
 async def get_chat_history(
     other_user_id: int,
-    skip: int = 0,
+    request: Request,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
     limit: int = 50,
     current_user: User = Depends(get_current_verified_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get chat message history with another user"""
+    """
+    Get chat message history with another user
+    Pass the created_at and id of the oldest message received as
+    before/before_id to load the previous page
+    """
     
     # Check if other user exists
-    result = await db.execute(select(User).where(User.id == other_user_id))
-    other_user = result.scalar_one_or_none()
+    other_user = await db.get(User, other_user_id)
     
     if not other_user:
         raise HTTPException(
@@ -203,37 +392,62 @@ async def get_chat_history(
             detail="User not found"
         )
     
-    # Get messages between current user and other user
+    # Get messages between current user and other user, matching the
+    # direction-independent conversation index
+    low_id, high_id = sorted((current_user.id, other_user_id))
+    query = select(*_MESSAGE_COLUMNS).where(
+        func.least(ChatMessage.sender_id, ChatMessage.receiver_id) == low_id,
+        func.greatest(ChatMessage.sender_id, ChatMessage.receiver_id) == high_id
+    )
+    
+    # Continue below the cursor (messages in one batch share created_at)
+    if before is not None and before_id is not None:
+        query = query.where(tuple_(ChatMessage.created_at, ChatMessage.id) < tuple_(before, before_id))
+    elif before is not None:
+        query = query.where(ChatMessage.created_at < before)
+    
     result = await db.execute(
-        select(ChatMessage)
-        .where(
-            or_(
-                and_(
-                    ChatMessage.sender_id == current_user.id,
-                    ChatMessage.receiver_id == other_user_id
-                ),
-                and_(
-                    ChatMessage.sender_id == other_user_id,
-                    ChatMessage.receiver_id == current_user.id
-                )
-            )
-        )
-        .order_by(ChatMessage.created_at.desc())
-        .offset(skip)
+        query
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
         .limit(limit)
     )
-    messages = result.scalars().all()
-    
-    # Mark messages from other user as read
-    for message in messages:
-        if message.receiver_id == current_user.id and not message.is_read:
-            message.is_read = True
-            message.read_at = datetime.utcnow()
+    rows = result.all()
     
+    # Mark messages from other user as read in one statement
+    read_at = datetime.utcnow()
+    marked = await db.execute(
+        update(ChatMessage)
+        .where(
+            ChatMessage.receiver_id == current_user.id,
+            ChatMessage.sender_id == other_user_id,
+            ChatMessage.is_read == False
+        )
+        .values(is_read=True, read_at=read_at),
+        execution_options={"synchronize_session": False}
+    )
+    if marked.rowcount:
+        await db.execute(
+            DECREMENT_UNREAD_COUNT,
+            {"uid": current_user.id, "peer": other_user_id, "read": marked.rowcount}
+        )
     await db.commit()
     
-    # Return messages in chronological order
-    return [MessageResponse.model_validate(msg) for msg in reversed(messages)]
+    # Return messages in chronological order, the received ones as just read
+    # (without validation, the values come straight from the database)
+    messages = []
+    for row in reversed(rows):
+        newly_read = row.receiver_id == current_user.id and row.is_read is False
+        messages.append(MessageEntry(
+            id=row.id,
+            content=row.content,
+            sender_id=row.sender_id,
+            receiver_id=row.receiver_id,
+            is_read=True if newly_read else row.is_read,
+            created_at=row.created_at,
+            read_at=read_at if newly_read else row.read_at
+        ))
+    
+    return json_response(request, chat_list_encoder.encode(messages))
 
 
 @router.post("/messages/{receiver_id}", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
@@ -245,16 +459,6 @@ async def send_message_rest(
 ):
     """Send a message (REST API fallback)"""
     
-    # Check if receiver exists
-    result = await db.execute(select(User).where(User.id == receiver_id))
-    receiver = result.scalar_one_or_none()
-    
-    if not receiver:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Receiver not found"
-        )
-    
     # Can't send message to yourself
     if receiver_id == current_user.id:
         raise HTTPException(
@@ -269,21 +473,28 @@ async def send_message_rest(
         receiver_id=receiver_id
     )
     db.add(message)
+    try:
+        await db.flush()
+    except IntegrityError:
+        # The receiver foreign key doubles as the existence check
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Receiver not found"
+        )
+    await record_conversation_activity(db, [message])
     await db.commit()
-    await db.refresh(message)
     
-    # Notify receiver if online via WebSocket
-    if receiver_id in active_connections:
-        receiver_ws = active_connections[receiver_id]
-        try:
-            await receiver_ws.send_json({
-                "type": "message",
-                "id": message.id,
-                "content": message.content,
-                "sender_id": current_user.id,
-                "created_at": message.created_at.isoformat()
-            })
-        except:
-            pass
+    # Notify receiver's connected devices via WebSocket
+    try:
+        await send_to_user(receiver_id, {
+            "type": "message",
+            "id": message.id,
+            "content": message.content,
+            "sender_id": current_user.id,
+            "created_at": message.created_at.isoformat()
+        })
+    except:
+        pass
     
     return MessageResponse.model_validate(message)
\ No newline at end of file
@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, func, literal, true, bindparam
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.orm import joinedload
 from typing import List
+import msgspec
 
 from app.db.session import get_db
 from app.models.user import User
 from app.models.photo import Photo
 from app.models.comment import Comment
-from app.schemas.comment import CommentCreate, CommentResponse, CommentUpdate, ReplyCreate
+from app.schemas.comment import CommentCreate, CommentResponse, CommentNode, CommentUpdate, ReplyCreate
 from app.api.deps import get_current_verified_user
+from app.services.cache_service import cache_set_indexed, cache_get_raw, cache_delete
+from app.utils.http import json_response
 
 # Router for /photos/{photo_id}/comments endpoints
 photo_comments_router = APIRouter()
@@ -16,39 +21,132 @@ photo_comments_router = APIRouter()
 # Router for /comments/{comment_id} endpoints
 router = APIRouter()
 
+# Seconds a photo's rendered comment tree stays cached
+COMMENTS_CACHE_EXPIRE = 30
 
-async def build_comment_tree(comments: List[Comment], db: AsyncSession) -> List[CommentResponse]:
-    """Build nested comment structure"""
-    comment_dict = {}
-    root_comments = []
+# Encoder for rendered comment trees, reused across requests
+comment_tree_encoder = msgspec.json.Encoder()
+
+
+def comment_author_index(author_id: int) -> str:
+    """Redis set of the cached comment trees an author appears in"""
+    return f"comments:author:{author_id}"
+
+
+def comment_tree_query():
+    """
+    Walk a photo's comment threads (photo_id parameter) with a recursive CTE
+    Rows come back depth-first, each reply right after its parent and
+    siblings in (created_at, id) order. The photo is outer joined so a
+    missing photo yields no rows and a photo without comments one empty row
+    """
+    # Sort key: (epoch, id) pairs along the path from the root comment
+    def path_step(created_at, comment_id):
+        return array([func.extract("epoch", created_at), comment_id])
+    
+    columns = (
+        Comment.id,
+        Comment.content,
+        Comment.photo_id,
+        Comment.author_id,
+        Comment.author_username,
+        Comment.author_profile_picture,
+        Comment.parent_id,
+        Comment.created_at,
+        Comment.updated_at
+    )
+    tree = (
+        select(*columns, literal(0).label("depth"), path_step(Comment.created_at, Comment.id).label("path"))
+        .where(Comment.photo_id == bindparam("photo_id"), Comment.parent_id.is_(None))
+        .cte("comment_tree", recursive=True)
+    )
+    reply = Comment.__table__.alias("reply")
+    tree = tree.union_all(
+        select(
+            *(reply.c[column.key] for column in columns),
+            tree.c.depth + 1,
+            tree.c.path.op("||")(path_step(reply.c.created_at, reply.c.id))
+        )
+        .join(tree, reply.c.parent_id == tree.c.id)
+    )
     
-    # First pass: create all comment responses
-    for comment in comments:
-        author_result = await db.execute(select(User).where(User.id == comment.author_id))
-        author = author_result.scalar_one()
-        
-        comment_response = CommentResponse(
-            id=comment.id,
-            content=comment.content,
-            photo_id=comment.photo_id,
-            author_id=comment.author_id,
-            author_username=author.username,
-            author_profile_picture=author.profile_picture,
-            parent_id=comment.parent_id,
-            created_at=comment.created_at,
-            updated_at=comment.updated_at,
+    return (
+        select(*(tree.c[column.key] for column in columns), tree.c.depth)
+        .select_from(Photo)
+        .outerjoin(tree, true())
+        .where(Photo.id == bindparam("photo_id"))
+        .order_by(tree.c.path)
+    )
+
+
+def comment_thread_delete():
+    """
+    Delete a comment (comment_id parameter) with all replies below it and
+    decrement the photo's (photo_id parameter) comment count by the number
+    of deleted rows, in one statement without loading replies
+    """
+    # The comment and all replies below it
+    thread = (
+        select(Comment.id)
+        .where(Comment.id == bindparam("comment_id"))
+        .cte("thread", recursive=True)
+    )
+    thread = thread.union_all(
+        select(Comment.id).join(thread, Comment.parent_id == thread.c.id)
+    )
+    
+    deleted = (
+        delete(Comment)
+        .where(Comment.id.in_(select(thread.c.id)))
+        .returning(Comment.id)
+        .cte("deleted")
+    )
+    return (
+        update(Photo)
+        .where(Photo.id == bindparam("photo_id"))
+        .values(
+            comments_count=func.greatest(
+                Photo.comments_count - select(func.count()).select_from(deleted).scalar_subquery(),
+                0
+            )
+        )
+        .add_cte(deleted)
+    )
+
+
+# Statements built once at import, so requests skip construction and cache-key work
+COMMENT_TREE = comment_tree_query()
+DELETE_COMMENT_THREAD = comment_thread_delete()
+
+
+def build_comment_tree(rows) -> List[CommentNode]:
+    """Build nested comment structure from depth-first ordered rows"""
+    root_comments = []
+    # Latest comment seen at each depth, i.e. the chain of open parents
+    parents: List[CommentNode] = []
+    
+    for row in rows:
+        # Skip validation, the values come straight from the database
+        comment_node = CommentNode(
+            id=row.id,
+            content=row.content,
+            photo_id=row.photo_id,
+            author_id=row.author_id,
+            author_username=row.author_username,
+            author_profile_picture=row.author_profile_picture,
+            parent_id=row.parent_id,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
             replies=[]
         )
-        comment_dict[comment.id] = comment_response
         
-        if comment.parent_id is None:
-            root_comments.append(comment_response)
-    
-    # Second pass: build tree structure
-    for comment in comments:
-        if comment.parent_id is not None and comment.parent_id in comment_dict:
-            parent = comment_dict[comment.parent_id]
-            parent.replies.append(comment_dict[comment.id])
+        if row.depth == 0:
+            root_comments.append(comment_node)
+        else:
+            parents[row.depth - 1].replies.append(comment_node)
+        
+        del parents[row.depth:]
+        parents.append(comment_node)
     
     return root_comments
 
@@ -65,8 +163,7 @@ async def create_comment(
     """Create a comment on a photo"""
     
     # Check if photo exists
-    result = await db.execute(select(Photo).where(Photo.id == photo_id))
-    photo = result.scalar_one_or_none()
+    photo = await db.get(Photo, photo_id)
     
     if not photo:
         raise HTTPException(
@@ -79,6 +176,8 @@ async def create_comment(
         content=comment_data.content,
         photo_id=photo_id,
         author_id=current_user.id,
+        author_username=current_user.username,
+        author_profile_picture=current_user.profile_picture,
         parent_id=None
     )
     db.add(comment)
@@ -87,7 +186,7 @@ async def create_comment(
     photo.comments_count += 1
     
     await db.commit()
-    await db.refresh(comment)
+    await cache_delete(f"comments:{photo_id}")
     
     return CommentResponse(
         id=comment.id,
@@ -106,30 +205,40 @@ async def create_comment(
 @photo_comments_router.get("", response_model=List[CommentResponse])
 async def get_comments(
     photo_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """Get all comments for a photo (nested structure)"""
     
-    # Check if photo exists
-    result = await db.execute(select(Photo).where(Photo.id == photo_id))
-    photo = result.scalar_one_or_none()
+    # Serve the rendered tree from cache when fresh
+    cache_key = f"comments:{photo_id}"
+    cached = await cache_get_raw(cache_key)
+    if cached is not None:
+        return json_response(request, cached)
     
-    if not photo:
+    # Get the photo's comment threads in one statement
+    result = await db.execute(COMMENT_TREE, {"photo_id": photo_id})
+    rows = result.all()
+    
+    # Check if photo exists
+    if not rows:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Photo not found"
         )
     
-    # Get all comments for this photo
-    result = await db.execute(
-        select(Comment)
-        .where(Comment.photo_id == photo_id)
-        .order_by(Comment.created_at.asc())
-    )
-    comments = result.scalars().all()
+    # Photo without comments
+    if rows[0].id is None:
+        rows = []
     
     # Build nested structure
-    return await build_comment_tree(comments, db)
+    body = comment_tree_encoder.encode(build_comment_tree(rows))
+    
+    # Indexed by author, so a profile change only drops the trees it shows up in
+    authors = {comment_author_index(row.author_id) for row in rows}
+    await cache_set_indexed(cache_key, body, COMMENTS_CACHE_EXPIRE, authors)
+    
+    return json_response(request, body)
 
 
 # ============ Comments Router (/comments/{comment_id}) ============
@@ -143,9 +252,8 @@ async def reply_to_comment(
 ):
     """Reply to an existing comment"""
     
-    # Get parent comment
-    result = await db.execute(select(Comment).where(Comment.id == comment_id))
-    parent_comment = result.scalar_one_or_none()
+    # Get parent comment together with its photo
+    parent_comment = await db.get(Comment, comment_id, options=[joinedload(Comment.photo)])
     
     if not parent_comment:
         raise HTTPException(
@@ -153,9 +261,8 @@ async def reply_to_comment(
             detail="Parent comment not found"
         )
     
-    # Get photo to increment comment count
-    result = await db.execute(select(Photo).where(Photo.id == parent_comment.photo_id))
-    photo = result.scalar_one_or_none()
+    # Photo to increment comment count
+    photo = parent_comment.photo
     
     if not photo:
         raise HTTPException(
@@ -168,6 +275,8 @@ async def reply_to_comment(
         content=reply_data.content,
         photo_id=parent_comment.photo_id,
         author_id=current_user.id,
+        author_username=current_user.username,
+        author_profile_picture=current_user.profile_picture,
         parent_id=comment_id
     )
     db.add(reply)
@@ -176,7 +285,7 @@ async def reply_to_comment(
     photo.comments_count += 1
     
     await db.commit()
-    await db.refresh(reply)
+    await cache_delete(f"comments:{reply.photo_id}")
     
     return CommentResponse(
         id=reply.id,
@@ -201,8 +310,7 @@ async def update_comment(
 ):
     """Update a comment (author only)"""
     
-    result = await db.execute(select(Comment).where(Comment.id == comment_id))
-    comment = result.scalar_one_or_none()
+    comment = await db.get(Comment, comment_id)
     
     if not comment:
         raise HTTPException(
@@ -218,7 +326,7 @@ async def update_comment(
     
     comment.content = comment_data.content
     await db.commit()
-    await db.refresh(comment)
+    await cache_delete(f"comments:{comment.photo_id}")
     
     return CommentResponse(
         id=comment.id,
@@ -242,8 +350,10 @@ async def delete_comment(
 ):
     """Delete a comment (author only)"""
     
-    result = await db.execute(select(Comment).where(Comment.id == comment_id))
-    comment = result.scalar_one_or_none()
+    result = await db.execute(
+        select(Comment.author_id, Comment.photo_id).where(Comment.id == comment_id)
+    )
+    comment = result.one_or_none()
     
     if not comment:
         raise HTTPException(
@@ -257,15 +367,12 @@ async def delete_comment(
             detail="Not authorized to delete this comment"
         )
     
-    # Get photo to decrement comment count
-    result = await db.execute(select(Photo).where(Photo.id == comment.photo_id))
-    photo = result.scalar_one_or_none()
-    
-    if photo:
-        photo.comments_count = max(0, photo.comments_count - 1)
-    
-    # Delete comment (cascade will delete replies)
-    await db.delete(comment)
+    # Delete the thread and update the photo's comment count
+    await db.execute(
+        DELETE_COMMENT_THREAD,
+        {"comment_id": comment_id, "photo_id": comment.photo_id}
+    )
     await db.commit()
+    await cache_delete(f"comments:{comment.photo_id}")
     
     return {"message": "Comment deleted successfully"}
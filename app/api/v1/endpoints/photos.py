@@ -1,25 +1,145 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Request, BackgroundTasks
+from fastapi.responses import FileResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func
-from typing import List, Optional
+from sqlalchemy import select, update, delete, exists, false, and_, or_, func, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from pydantic import TypeAdapter
+from cachetools import TTLCache
+from typing import List, Optional, Annotated, Dict
+import hashlib
+import msgspec
+from urllib.parse import quote
 
-from app.db.session import get_db
+from app.core.config import settings
+from app.db.session import get_db, AsyncSessionLocal
+# Every model, so mappers can be configured for the statements built at import
+import app.db.base  # noqa: F401
 from app.models.user import User
 from app.models.photo import Photo, PhotoLike, Category, PhotoCategory
-from app.schemas.photo import PhotoResponse, PhotoCreate, PhotoUpdate, PhotoListItem, PhotoFilter, CategoryResponse
+from app.schemas.photo import PhotoResponse, PhotoCreate, PhotoUpdate, PhotoListItem, PhotoListEntry, PhotoFilter, CategoryResponse, IdList
 from app.api.deps import get_current_verified_user, get_optional_current_user
 from app.utils.image import save_upload_file, delete_file, get_file_url
+from app.utils.http import json_response
+from app.services.cache_service import cache_set_indexed, cache_get_raw, cache_delete, cache_delete_index
 
 router = APIRouter()
 
+# Seconds cached responses stay fresh (categories only change via migrations)
+CATEGORIES_CACHE_EXPIRE = 600
+PHOTO_LIST_CACHE_EXPIRE = 15
+
+# Redis set of the cached photo list pages, dropped on upload and delete
+PHOTO_LIST_CACHE_INDEX = "photos:list:index"
+
+# Largest photo list page served
+PHOTO_LIST_MAX_LIMIT = 100
+
+# Seconds clients and CDNs may reuse a downloaded photo file
+DOWNLOAD_CACHE_MAX_AGE = 31536000
+
+category_list_adapter = TypeAdapter(List[CategoryResponse])
+# Encoder for photo list pages, reused across requests
+photo_list_encoder = msgspec.json.Encoder()
+
+# All categories by id, kept per process
+_category_cache: TTLCache = TTLCache(maxsize=1, ttl=CATEGORIES_CACHE_EXPIRE)
+
+
+def photo_detail_query(liked):
+    """Photo (photo_id parameter) with its owner joined in and categories selectin-loaded"""
+    return (
+        select(Photo, liked.label("is_liked"))
+        .options(joinedload(Photo.owner), selectinload(Photo.categories))
+        .where(Photo.id == bindparam("photo_id"))
+    )
+
+
+# Statements for the hot paths, built once at import so requests skip
+# construction and cache-key work
+GET_PHOTO_DETAIL = photo_detail_query(
+    exists().where(
+        and_(
+            PhotoLike.photo_id == Photo.id,
+            PhotoLike.user_id == bindparam("user_id")
+        )
+    )
+)
+GET_PHOTO_DETAIL_ANONYMOUS = photo_detail_query(false())
+
+# (VALUES/SET parameters can't share a column's name)
+INSERT_PHOTO_LIKE = (
+    pg_insert(PhotoLike)
+    .values(photo_id=bindparam("pid"), user_id=bindparam("uid"))
+    .on_conflict_do_nothing(index_elements=["photo_id", "user_id"])
+    .returning(PhotoLike.id)
+)
+INCREMENT_PHOTO_LIKES = (
+    update(Photo)
+    .where(Photo.id == bindparam("pid"))
+    .values(likes_count=Photo.likes_count + 1)
+)
+
+DELETE_PHOTO_LIKE = (
+    delete(PhotoLike)
+    .where(
+        and_(
+            PhotoLike.photo_id == bindparam("photo_id"),
+            PhotoLike.user_id == bindparam("user_id")
+        )
+    )
+    .returning(PhotoLike.id)
+)
+DECREMENT_PHOTO_LIKES = (
+    update(Photo)
+    .where(Photo.id == bindparam("pid"))
+    .values(likes_count=func.greatest(Photo.likes_count - 1, 0))
+)
+
+# Owner's photo counter, moved by delta (keeps updated_at, not a profile edit)
+ADJUST_PHOTOS_COUNT = (
+    update(User)
+    .where(User.id == bindparam("uid"))
+    .values(
+        photos_count=func.greatest(User.photos_count + bindparam("delta"), 0),
+        updated_at=User.updated_at
+    )
+)
+
+
+async def increment_photo_views(photo_id: int):
+    """Count a photo view with an atomic UPDATE (runs after the response)"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Photo)
+            .where(Photo.id == photo_id)
+            # Keep updated_at, a view is not an edit
+            .values(views_count=Photo.views_count + 1, updated_at=Photo.updated_at)
+        )
+        await db.commit()
+
+
+async def get_category_map(db: AsyncSession) -> Dict[int, CategoryResponse]:
+    """Get all categories by id (ordered by name), cached in-process"""
+    categories = _category_cache.get("all")
+    if categories is None:
+        # Only the columns the response carries
+        result = await db.execute(
+            select(Category.id, Category.name, Category.slug, Category.description)
+            .order_by(Category.name)
+        )
+        categories = {row.id: CategoryResponse.model_validate(row) for row in result}
+        _category_cache["all"] = categories
+    return categories
+
 
 @router.get("/categories", response_model=List[CategoryResponse])
-async def get_categories(db: AsyncSession = Depends(get_db)):
+async def get_categories(request: Request, db: AsyncSession = Depends(get_db)):
     """Get all available categories"""
-    result = await db.execute(select(Category).order_by(Category.name))
-    categories = result.scalars().all()
-    return [CategoryResponse.model_validate(cat) for cat in categories]
+    categories = await get_category_map(db)
+    body = category_list_adapter.dump_json(list(categories.values()))
+    return json_response(request, body)
 
 
 @router.post("", response_model=PhotoResponse, status_code=status.HTTP_201_CREATED)
@@ -27,7 +147,7 @@ async def upload_photo(
     file: UploadFile = File(...),
     title: str = Form(...),
     description: Optional[str] = Form(None),
-    category_ids: str = Form(""),  # Comma-separated category IDs
+    category_ids: Annotated[IdList, Form()] = [],  # Comma-separated or repeated category IDs
     current_user: User = Depends(get_current_verified_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -50,23 +170,22 @@ async def upload_photo(
     db.add(photo)
     await db.flush()
     
-    # Add categories
+    # Add categories in one multi-row INSERT (repeated ids are skipped)
     if category_ids:
-        cat_id_list = [int(cid.strip()) for cid in category_ids.split(",") if cid.strip()]
-        for cat_id in cat_id_list:
-            photo_cat = PhotoCategory(photo_id=photo.id, category_id=cat_id)
-            db.add(photo_cat)
+        await db.execute(
+            pg_insert(PhotoCategory)
+            .values([{"photo_id": photo.id, "category_id": cat_id} for cat_id in category_ids])
+            .on_conflict_do_nothing()
+        )
     
+    await db.execute(ADJUST_PHOTOS_COUNT, {"uid": current_user.id, "delta": 1})
     await db.commit()
-    await db.refresh(photo)
+    await cache_delete_index(PHOTO_LIST_CACHE_INDEX)
+    await cache_delete(f"profile:{current_user.id}")
     
-    # Load categories
-    result = await db.execute(
-        select(Category)
-        .join(PhotoCategory)
-        .where(PhotoCategory.photo_id == photo.id)
-    )
-    categories = result.scalars().all()
+    # Categories from the in-process map, the ids are already known
+    category_map = await get_category_map(db)
+    categories = [category_map[cat_id] for cat_id in dict.fromkeys(category_ids) if cat_id in category_map]
     
     return PhotoResponse(
         id=photo.id,
@@ -83,14 +202,15 @@ async def upload_photo(
         comments_count=photo.comments_count,
         created_at=photo.created_at,
         updated_at=photo.updated_at,
-        categories=[CategoryResponse.model_validate(cat) for cat in categories],
+        categories=categories,
         is_liked=False
     )
 
 
 @router.get("", response_model=List[PhotoListItem])
 async def list_photos(
-    category_ids: Optional[str] = None,
+    request: Request,
+    category_ids: Annotated[IdList, Query()] = [],
     owner_id: Optional[int] = None,
     search: Optional[str] = None,
     skip: int = 0,
@@ -99,12 +219,38 @@ async def list_photos(
 ):
     """List photos with filters (search, category, owner)"""
     
-    query = select(Photo).join(User, Photo.owner_id == User.id)
+    # Bounded pages, so the cache keys stay bounded too
+    skip = max(skip, 0)
+    limit = min(max(limit, 1), PHOTO_LIST_MAX_LIMIT)
+    
+    # Serve from cache when the same page was rendered recently (free-form
+    # searches are not cached, each would add a key of its own)
+    cache_key = None
+    if not search:
+        params = repr((category_ids, owner_id, skip, limit)).encode()
+        cache_key = f"photos:list:{hashlib.blake2b(params, digest_size=16).hexdigest()}"
+        cached = await cache_get_raw(cache_key)
+        if cached is not None:
+            return json_response(request, cached)
+    
+    # Plain rows with just the list item columns (no ORM objects, no
+    # description), owners coming from the same joined row
+    query = select(
+        Photo.id,
+        Photo.title,
+        Photo.file_path,
+        Photo.width,
+        Photo.height,
+        Photo.owner_id,
+        User.username.label("owner_username"),
+        Photo.likes_count,
+        Photo.comments_count,
+        Photo.created_at
+    ).join(Photo.owner)
     
     # Filter by categories
     if category_ids:
-        cat_id_list = [int(cid.strip()) for cid in category_ids.split(",") if cid.strip()]
-        query = query.join(PhotoCategory).where(PhotoCategory.category_id.in_(cat_id_list))
+        query = query.join(PhotoCategory).where(PhotoCategory.category_id.in_(category_ids))
     
     # Filter by owner
     if owner_id:
@@ -124,73 +270,59 @@ async def list_photos(
     query = query.order_by(Photo.created_at.desc()).offset(skip).limit(limit)
     
     result = await db.execute(query)
-    photos = result.scalars().all()
+    rows = result.all()
     
-    # Build response
+    # Build response (without validation, the values come straight from the database)
     photo_list = []
-    for photo in photos:
-        owner_result = await db.execute(select(User).where(User.id == photo.owner_id))
-        owner = owner_result.scalar_one()
-        
-        photo_list.append(PhotoListItem(
-            id=photo.id,
-            title=photo.title,
-            file_path=get_file_url(photo.file_path),
-            width=photo.width,
-            height=photo.height,
-            owner_id=photo.owner_id,
-            owner_username=owner.username,
-            likes_count=photo.likes_count,
-            comments_count=photo.comments_count,
-            created_at=photo.created_at
+    for row in rows:
+        photo_list.append(PhotoListEntry(
+            id=row.id,
+            title=row.title,
+            file_path=get_file_url(row.file_path),
+            width=row.width,
+            height=row.height,
+            owner_id=row.owner_id,
+            owner_username=row.owner_username,
+            likes_count=row.likes_count,
+            comments_count=row.comments_count,
+            created_at=row.created_at
         ))
     
-    return photo_list
+    body = photo_list_encoder.encode(photo_list)
+    if cache_key is not None:
+        await cache_set_indexed(cache_key, body, PHOTO_LIST_CACHE_EXPIRE, [PHOTO_LIST_CACHE_INDEX])
+    
+    return json_response(request, body)
 
 
 @router.get("/{photo_id}", response_model=PhotoResponse)
 async def get_photo(
     photo_id: int,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_optional_current_user)
 ):
     """Get photo by ID"""
     
-    result = await db.execute(select(Photo).where(Photo.id == photo_id))
-    photo = result.scalar_one_or_none()
+    # Photo with owner, categories and whether the current user liked it
+    if current_user:
+        result = await db.execute(GET_PHOTO_DETAIL, {"photo_id": photo_id, "user_id": current_user.id})
+    else:
+        result = await db.execute(GET_PHOTO_DETAIL_ANONYMOUS, {"photo_id": photo_id})
+    row = result.one_or_none()
     
-    if not photo:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Photo not found"
         )
     
-    # Increment views
-    photo.views_count += 1
-    await db.commit()
-    
-    # Get owner
-    owner_result = await db.execute(select(User).where(User.id == photo.owner_id))
-    owner = owner_result.scalar_one()
-    
-    # Get categories
-    cat_result = await db.execute(
-        select(Category).join(PhotoCategory).where(PhotoCategory.photo_id == photo.id)
-    )
-    categories = cat_result.scalars().all()
+    photo, is_liked = row
+    owner = photo.owner
+    categories = photo.categories
     
-    # Check if current user liked this photo
-    is_liked = False
-    if current_user:
-        like_result = await db.execute(
-            select(PhotoLike).where(
-                and_(
-                    PhotoLike.photo_id == photo_id,
-                    PhotoLike.user_id == current_user.id
-                )
-            )
-        )
-        is_liked = like_result.scalar_one_or_none() is not None
+    # Increment views once the response is sent
+    background_tasks.add_task(increment_photo_views, photo_id)
     
     return PhotoResponse(
         id=photo.id,
@@ -202,7 +334,7 @@ async def get_photo(
         height=photo.height,
         owner_id=photo.owner_id,
         owner_username=owner.username,
-        views_count=photo.views_count,
+        views_count=photo.views_count + 1,
         likes_count=photo.likes_count,
         comments_count=photo.comments_count,
         created_at=photo.created_at,
@@ -220,8 +352,7 @@ async def delete_photo(
 ):
     """Delete a photo (owner only)"""
     
-    result = await db.execute(select(Photo).where(Photo.id == photo_id))
-    photo = result.scalar_one_or_none()
+    photo = await db.get(Photo, photo_id)
     
     if not photo:
         raise HTTPException(
@@ -240,7 +371,10 @@ async def delete_photo(
     
     # Delete from database
     await db.delete(photo)
+    await db.execute(ADJUST_PHOTOS_COUNT, {"uid": current_user.id, "delta": -1})
     await db.commit()
+    await cache_delete_index(PHOTO_LIST_CACHE_INDEX)
+    await cache_delete(f"comments:{photo_id}", f"profile:{current_user.id}")
     
     return {"message": "Photo deleted successfully"}
 
@@ -253,39 +387,25 @@ async def like_photo(
 ):
     """Like a photo"""
     
-    # Check if photo exists
-    result = await db.execute(select(Photo).where(Photo.id == photo_id))
-    photo = result.scalar_one_or_none()
-    
-    if not photo:
+    # Create like unless it exists (the unique constraint decides)
+    try:
+        result = await db.execute(INSERT_PHOTO_LIKE, {"pid": photo_id, "uid": current_user.id})
+    except IntegrityError:
+        # The photo foreign key doubles as the existence check
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Photo not found"
         )
     
-    # Check if already liked
-    result = await db.execute(
-        select(PhotoLike).where(
-            and_(
-                PhotoLike.photo_id == photo_id,
-                PhotoLike.user_id == current_user.id
-            )
-        )
-    )
-    existing_like = result.scalar_one_or_none()
-    
-    if existing_like:
+    if result.first() is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Photo already liked"
         )
     
-    # Create like
-    like = PhotoLike(photo_id=photo_id, user_id=current_user.id)
-    db.add(like)
-    
     # Increment likes count
-    photo.likes_count += 1
+    await db.execute(INCREMENT_PHOTO_LIKES, {"pid": photo_id})
     
     await db.commit()
     
@@ -300,33 +420,17 @@ async def unlike_photo(
 ):
     """Unlike a photo"""
     
-    # Find like
-    result = await db.execute(
-        select(PhotoLike).where(
-            and_(
-                PhotoLike.photo_id == photo_id,
-                PhotoLike.user_id == current_user.id
-            )
-        )
-    )
-    like = result.scalar_one_or_none()
+    # Delete like, the returned row tells whether there was one
+    result = await db.execute(DELETE_PHOTO_LIKE, {"photo_id": photo_id, "user_id": current_user.id})
     
-    if not like:
+    if result.first() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Photo not liked"
         )
     
-    # Get photo
-    result = await db.execute(select(Photo).where(Photo.id == photo_id))
-    photo = result.scalar_one_or_none()
-    
-    # Delete like
-    await db.delete(like)
-    
     # Decrement likes count
-    if photo:
-        photo.likes_count = max(0, photo.likes_count - 1)
+    await db.execute(DECREMENT_PHOTO_LIKES, {"pid": photo_id})
     
     await db.commit()
     
@@ -340,8 +444,10 @@ async def download_photo(
 ):
     """Download photo file"""
     
-    result = await db.execute(select(Photo).where(Photo.id == photo_id))
-    photo = result.scalar_one_or_none()
+    result = await db.execute(
+        select(Photo.file_path, Photo.file_name).where(Photo.id == photo_id)
+    )
+    photo = result.one_or_none()
     
     if not photo:
         raise HTTPException(
@@ -349,8 +455,24 @@ async def download_photo(
             detail="Photo not found"
         )
     
+    # Let nginx send the file with sendfile(2), keeping Python off the byte path
+    if settings.UPLOADS_ACCEL_PREFIX:
+        # Same Content-Disposition FileResponse would send
+        file_name = quote(photo.file_name)
+        if file_name != photo.file_name:
+            disposition = f"attachment; filename*=utf-8''{file_name}"
+        else:
+            disposition = f'attachment; filename="{photo.file_name}"'
+        return Response(headers={
+            "X-Accel-Redirect": f"{settings.UPLOADS_ACCEL_PREFIX.rstrip('/')}/{quote(photo.file_path)}",
+            "Content-Disposition": disposition,
+            "Cache-Control": f"public, max-age={DOWNLOAD_CACHE_MAX_AGE}, immutable"
+        })
+    
+    # Media type is guessed from the file name, so the image type is served.
+    # Stored files get a unique name and never change, so caches may keep them
     return FileResponse(
         path=photo.file_path,
         filename=photo.file_name,
-        media_type="application/octet-stream"
-    )
\ No newline at end of file
+        headers={"Cache-Control": f"public, max-age={DOWNLOAD_CACHE_MAX_AGE}, immutable"}
+    )
@@ -1,14 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select, update, delete, and_, or_, case, func, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 
 from app.db.session import get_db
 from app.models.user import User
 from app.models.social import Follow, Block
 from app.api.deps import get_current_verified_user
+from app.services.cache_service import cache_delete
 
 router = APIRouter()
 
+# Follower's following_count and followed user's followers_count, moved by
+# delta in one statement (keeps updated_at, a follow is not a profile edit)
+ADJUST_FOLLOW_COUNTS = (
+    update(User)
+    .where(User.id.in_([bindparam("follower"), bindparam("followed")]))
+    .values(
+        following_count=case(
+            (User.id == bindparam("follower"), func.greatest(User.following_count + bindparam("delta"), 0)),
+            else_=User.following_count
+        ),
+        followers_count=case(
+            (User.id == bindparam("followed"), func.greatest(User.followers_count + bindparam("delta"), 0)),
+            else_=User.followers_count
+        ),
+        updated_at=User.updated_at
+    )
+)
+
 
 @router.post("/follow/{user_id}", response_model=dict)
 async def follow_user(
@@ -25,36 +46,9 @@ async def follow_user(
             detail="Cannot follow yourself"
         )
     
-    # Check if user exists
-    result = await db.execute(select(User).where(User.id == user_id))
-    user_to_follow = result.scalar_one_or_none()
-    
-    if not user_to_follow:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    # Check if already following
-    result = await db.execute(
-        select(Follow).where(
-            and_(
-                Follow.follower_id == current_user.id,
-                Follow.followed_id == user_id
-            )
-        )
-    )
-    existing_follow = result.scalar_one_or_none()
-    
-    if existing_follow:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Already following this user"
-        )
-    
     # Check if user is blocked
     result = await db.execute(
-        select(Block).where(
+        select(Block.id).where(
             and_(
                 Block.blocker_id == current_user.id,
                 Block.blocked_id == user_id
@@ -69,14 +63,34 @@ async def follow_user(
             detail="Cannot follow a blocked user"
         )
     
-    # Create follow relationship
-    follow = Follow(
-        follower_id=current_user.id,
-        followed_id=user_id
-    )
-    db.add(follow)
+    # Create follow relationship unless it exists (the unique constraint decides)
+    try:
+        result = await db.execute(
+            pg_insert(Follow)
+            .values(follower_id=current_user.id, followed_id=user_id)
+            .on_conflict_do_nothing(index_elements=["follower_id", "followed_id"])
+            .returning(Follow.id)
+        )
+    except IntegrityError:
+        # The followed user foreign key doubles as the existence check
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    if result.first() is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Already following this user"
+        )
+    
+    await db.execute(ADJUST_FOLLOW_COUNTS, {"follower": current_user.id, "followed": user_id, "delta": 1})
     await db.commit()
     
+    # Both users' cached follower / following counts changed
+    await cache_delete(f"profile:{current_user.id}", f"profile:{user_id}")
+    
     return {"message": "User followed successfully"}
 
 
@@ -88,26 +102,30 @@ async def unfollow_user(
 ):
     """Unfollow a user"""
     
-    # Find follow relationship
+    # Delete follow relationship, the returned row tells whether there was one
     result = await db.execute(
-        select(Follow).where(
+        delete(Follow)
+        .where(
             and_(
                 Follow.follower_id == current_user.id,
                 Follow.followed_id == user_id
             )
         )
+        .returning(Follow.id)
     )
-    follow = result.scalar_one_or_none()
     
-    if not follow:
+    if result.first() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Not following this user"
         )
     
-    await db.delete(follow)
+    await db.execute(ADJUST_FOLLOW_COUNTS, {"follower": current_user.id, "followed": user_id, "delta": -1})
     await db.commit()
     
+    # Both users' cached follower / following counts changed
+    await cache_delete(f"profile:{current_user.id}", f"profile:{user_id}")
+    
     return {"message": "User unfollowed successfully"}
 
 
@@ -126,36 +144,32 @@ async def block_user(
             detail="Cannot block yourself"
         )
     
-    # Check if user exists
-    result = await db.execute(select(User).where(User.id == user_id))
-    user_to_block = result.scalar_one_or_none()
-    
-    if not user_to_block:
+    # Create block unless it exists (the unique constraint decides)
+    try:
+        result = await db.execute(
+            pg_insert(Block)
+            .values(blocker_id=current_user.id, blocked_id=user_id)
+            .on_conflict_do_nothing(index_elements=["blocker_id", "blocked_id"])
+            .returning(Block.id)
+        )
+    except IntegrityError:
+        # The blocked user foreign key doubles as the existence check
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    # Check if already blocked
-    result = await db.execute(
-        select(Block).where(
-            and_(
-                Block.blocker_id == current_user.id,
-                Block.blocked_id == user_id
-            )
-        )
-    )
-    existing_block = result.scalar_one_or_none()
-    
-    if existing_block:
+    if result.first() is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User already blocked"
         )
     
     # Remove follow relationships if they exist
-    await db.execute(
-        select(Follow).where(
+    result = await db.execute(
+        delete(Follow)
+        .where(
             or_(
                 and_(
                     Follow.follower_id == current_user.id,
@@ -167,16 +181,16 @@ async def block_user(
                 )
             )
         )
+        .returning(Follow.follower_id, Follow.followed_id)
     )
+    for follower_id, followed_id in result.all():
+        await db.execute(ADJUST_FOLLOW_COUNTS, {"follower": follower_id, "followed": followed_id, "delta": -1})
     
-    # Create block
-    block = Block(
-        blocker_id=current_user.id,
-        blocked_id=user_id
-    )
-    db.add(block)
     await db.commit()
     
+    # Both users' cached follower / following counts changed
+    await cache_delete(f"profile:{current_user.id}", f"profile:{user_id}")
+    
     return {"message": "User blocked successfully"}
 
 
@@ -188,24 +202,24 @@ async def unblock_user(
 ):
     """Unblock a user"""
     
-    # Find block relationship
+    # Delete block, the returned row tells whether there was one
     result = await db.execute(
-        select(Block).where(
+        delete(Block)
+        .where(
             and_(
                 Block.blocker_id == current_user.id,
                 Block.blocked_id == user_id
             )
         )
+        .returning(Block.id)
     )
-    block = result.scalar_one_or_none()
     
-    if not block:
+    if result.first() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not blocked"
         )
     
-    await db.delete(block)
     await db.commit()
     
     return {"message": "User unblocked successfully"}
\ No newline at end of file
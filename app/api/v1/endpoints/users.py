@@ -1,26 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, exists, and_, or_, bindparam
+from typing import Optional
+import msgspec
 
 from app.db.session import get_db
 from app.models.user import User
 from app.models.social import Follow, Block
-from app.models.photo import Photo
-from app.schemas.user import UserResponse, UserUpdate, UserProfile, UserWithStats
-from app.api.deps import get_current_user, get_current_verified_user
-from app.utils.image import save_upload_file, delete_file
+from app.schemas.user import UserResponse, UserUpdate, UserProfile, UserProfilePage, UserProfileEntry, UserListPage, UserWithStats
+from app.api.deps import get_current_user, get_current_verified_user, invalidate_cached_user
+from app.api.v1.endpoints.comments import comment_author_index
+from app.utils.image import save_raw_file, delete_file, delete_thumbnails
+from app.utils.http import json_response
+from app.services.cache_service import cache_set, cache_get_raw, cache_delete, cache_delete_index
 from app.core.config import settings
+from app.tasks.image_tasks import process_profile_picture
 
 router = APIRouter()
 
+# Seconds a user's public profile and counts stay cached
+PROFILE_CACHE_EXPIRE = 120
+
+# Encoder for follower / following pages, reused across requests
+user_list_encoder = msgspec.json.Encoder()
+
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_profile(
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """Get current user profile"""
-    return UserResponse.model_validate(current_user)
+    return json_response(request, UserResponse.model_validate(current_user).model_dump_json())
 
 
 @router.put("/me", response_model=UserResponse)
@@ -31,28 +43,31 @@ async def update_profile(
 ):
     """Update current user profile"""
     
-    # Check if username is taken
-    if user_data.username and user_data.username != current_user.username:
-        result = await db.execute(
-            select(User).where(
-                and_(
-                    User.username == user_data.username,
-                    User.id != current_user.id
-                )
-            )
-        )
-        if result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Username already taken"
-            )
+    # Attach the (possibly cached) user to this session so changes are tracked
+    current_user = await db.merge(current_user, load=False)
+    
+    username_changed = bool(user_data.username) and user_data.username != current_user.username
+    if username_changed:
         current_user.username = user_data.username
     
     if user_data.bio is not None:
         current_user.bio = user_data.bio
     
-    await db.commit()
-    await db.refresh(current_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # The unique username index doubles as the "taken" check
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username already taken"
+        )
+    invalidate_cached_user(current_user.id)
+    await cache_delete(f"profile:{current_user.id}")
+    
+    # Cached comment trees show the old name
+    if username_changed:
+        await cache_delete_index(comment_author_index(current_user.id))
     
     return UserResponse.model_validate(current_user)
 
@@ -65,35 +80,101 @@ async def upload_profile_picture(
 ):
     """Upload or update profile picture"""
     
-    # Delete old profile picture if exists
+    current_user = await db.merge(current_user, load=False)
+    
+    # Delete old profile picture and its thumbnails if exists
     if current_user.profile_picture:
         delete_file(current_user.profile_picture)
+        delete_thumbnails(current_user.profile_picture)
     
-    # Save new profile picture
-    filepath, _, _, _ = await save_upload_file(
-        file,
-        upload_dir=settings.PROFILE_UPLOAD_DIR,
-        compress=True
-    )
+    # Save new profile picture, a Celery worker compresses it and
+    # fills in the thumbnail sizes afterwards
+    filepath = await save_raw_file(file, upload_dir=settings.PROFILE_UPLOAD_DIR)
     
     current_user.profile_picture = filepath
+    current_user.profile_picture_sizes = None
     await db.commit()
-    await db.refresh(current_user)
+    process_profile_picture.delay(current_user.id, filepath)
+    invalidate_cached_user(current_user.id)
+    await cache_delete(f"profile:{current_user.id}")
+    
+    # Cached comment trees show the old picture
+    await cache_delete_index(comment_author_index(current_user.id))
     
     return UserResponse.model_validate(current_user)
 
 
+def relation_flags(viewer_id: int, user_id):
+    """EXISTS columns telling whether the viewer follows / has blocked user_id"""
+    return (
+        exists().where(
+            and_(
+                Follow.follower_id == viewer_id,
+                Follow.followed_id == user_id
+            )
+        ).label("is_following"),
+        exists().where(
+            and_(
+                Block.blocker_id == viewer_id,
+                Block.blocked_id == user_id
+            )
+        ).label("is_blocked")
+    )
+
+
+# Both relation checks in one round trip, built once at import
+GET_RELATION_FLAGS = select(*relation_flags(bindparam("viewer_id"), bindparam("user_id")))
+
+
 @router.get("/{user_id}", response_model=UserWithStats)
 async def get_user_profile(
     user_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get user profile by ID"""
+    """
+    Get user profile by ID
+    The ETag hashes the body, so it also changes with the viewer's relation to the user
+    """
     
-    # Get user
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    # The public part (profile and counts) is shared by all viewers
+    cache_key = f"profile:{user_id}"
+    cached = await cache_get_raw(cache_key)
+    if cached is not None:
+        profile = UserProfile.model_validate_json(cached)
+        
+        # Only the current user's relation to the profile is looked up
+        result = await db.execute(
+            GET_RELATION_FLAGS,
+            {"viewer_id": current_user.id, "user_id": user_id}
+        )
+        flags = result.one()
+        
+        body = UserWithStats(
+            **profile.model_dump(),
+            is_following=flags.is_following,
+            is_blocked=flags.is_blocked
+        ).model_dump_json()
+        return json_response(request, body)
+    
+    # Profile, its counter columns and the current user's relation to it
+    result = await db.execute(
+        select(
+            User.id,
+            User.username,
+            User.bio,
+            User.profile_picture,
+            User.profile_picture_sizes,
+            User.created_at,
+            User.followers_count,
+            User.following_count,
+            User.photos_count,
+            *relation_flags(current_user.id, User.id)
+        )
+        .where(User.id == user_id)
+    )
+    user = result.one_or_none()
     
     if not user:
         raise HTTPException(
@@ -101,94 +182,119 @@ async def get_user_profile(
             detail="User not found"
         )
     
-    # Get stats
-    followers_count = await db.scalar(
-        select(func.count()).select_from(Follow).where(Follow.followed_id == user_id)
-    )
-    following_count = await db.scalar(
-        select(func.count()).select_from(Follow).where(Follow.follower_id == user_id)
-    )
-    photos_count = await db.scalar(
-        select(func.count()).select_from(Photo).where(Photo.owner_id == user_id)
-    )
-    
-    # Check if current user is following this user
-    is_following = False
-    if current_user:
-        result = await db.execute(
-            select(Follow).where(
-                and_(
-                    Follow.follower_id == current_user.id,
-                    Follow.followed_id == user_id
-                )
-            )
-        )
-        is_following = result.scalar_one_or_none() is not None
-    
-    # Check if current user has blocked this user
-    is_blocked = False
-    if current_user:
-        result = await db.execute(
-            select(Block).where(
-                and_(
-                    Block.blocker_id == current_user.id,
-                    Block.blocked_id == user_id
-                )
-            )
-        )
-        is_blocked = result.scalar_one_or_none() is not None
-    
-    return UserWithStats(
+    profile = UserProfile(
         id=user.id,
         username=user.username,
         bio=user.bio,
         profile_picture=user.profile_picture,
+        profile_picture_sizes=user.profile_picture_sizes,
         created_at=user.created_at,
-        followers_count=followers_count or 0,
-        following_count=following_count or 0,
-        photos_count=photos_count or 0,
-        is_following=is_following,
-        is_blocked=is_blocked
+        followers_count=user.followers_count,
+        following_count=user.following_count,
+        photos_count=user.photos_count
+    )
+    await cache_set(cache_key, profile.model_dump_json(), PROFILE_CACHE_EXPIRE)
+    
+    body = UserWithStats(
+        **profile.model_dump(),
+        is_following=user.is_following,
+        is_blocked=user.is_blocked
+    ).model_dump_json()
+    return json_response(request, body)
+
+
+# Columns of a UserProfile, selected as plain rows (no ORM objects)
+_PROFILE_COLUMNS = (
+    User.id,
+    User.username,
+    User.bio,
+    User.profile_picture,
+    User.profile_picture_sizes,
+    User.created_at,
+    User.followers_count,
+    User.following_count,
+    User.photos_count,
+)
+
+
+def user_list_query(user_column, other_column):
+    """Profile columns of users linked by a follow row to bindparam user_id, newest first"""
+    return (
+        select(*_PROFILE_COLUMNS, Follow.id.label("follow_id"))
+        .join(Follow, user_column == User.id)
+        .where(other_column == bindparam("user_id"))
+        .order_by(Follow.id.desc())
+        .limit(bindparam("limit"))
     )
 
 
-@router.get("/{user_id}/followers", response_model=List[UserProfile])
+# Follower / followed user lists, built once at import
+GET_FOLLOWERS = user_list_query(Follow.follower_id, Follow.followed_id)
+GET_FOLLOWING = user_list_query(Follow.followed_id, Follow.follower_id)
+
+
+def user_list_page(rows, limit: int) -> UserListPage:
+    """Build a page of profiles, with a cursor when more may follow"""
+    # Build response (without validation, the values come straight from the database)
+    items = []
+    for row in rows:
+        items.append(UserProfileEntry(
+            id=row.id,
+            username=row.username,
+            bio=row.bio,
+            profile_picture=row.profile_picture,
+            profile_picture_sizes=row.profile_picture_sizes,
+            created_at=row.created_at,
+            followers_count=row.followers_count,
+            following_count=row.following_count,
+            photos_count=row.photos_count
+        ))
+    
+    next_cursor = rows[-1].follow_id if rows and len(rows) == limit else None
+    return UserListPage(items=items, next_cursor=next_cursor)
+
+
+@router.get("/{user_id}/followers", response_model=UserProfilePage)
 async def get_followers(
     user_id: int,
-    skip: int = 0,
+    request: Request,
+    cursor: Optional[int] = None,
     limit: int = 20,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get user's followers"""
+    """
+    Get user's followers, most recent first
+    Pass the next_cursor of a page as cursor to load the next one
+    """
     
-    result = await db.execute(
-        select(User)
-        .join(Follow, Follow.follower_id == User.id)
-        .where(Follow.followed_id == user_id)
-        .offset(skip)
-        .limit(limit)
-    )
-    followers = result.scalars().all()
+    # Continue below the cursor (an index seek, however deep the page)
+    query = GET_FOLLOWERS
+    if cursor is not None:
+        query = query.where(Follow.id < cursor)
+    
+    result = await db.execute(query, {"user_id": user_id, "limit": limit})
     
-    return [UserProfile.model_validate(user) for user in followers]
+    return json_response(request, user_list_encoder.encode(user_list_page(result.all(), limit)))
 
 
-@router.get("/{user_id}/following", response_model=List[UserProfile])
+@router.get("/{user_id}/following", response_model=UserProfilePage)
 async def get_following(
     user_id: int,
-    skip: int = 0,
+    request: Request,
+    cursor: Optional[int] = None,
     limit: int = 20,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get users that this user is following"""
+    """
+    Get users that this user is following, most recently followed first
+    Pass the next_cursor of a page as cursor to load the next one
+    """
     
-    result = await db.execute(
-        select(User)
-        .join(Follow, Follow.followed_id == User.id)
-        .where(Follow.follower_id == user_id)
-        .offset(skip)
-        .limit(limit)
-    )
-    following = result.scalars().all()
+    # Continue below the cursor (an index seek, however deep the page)
+    query = GET_FOLLOWING
+    if cursor is not None:
+        query = query.where(Follow.id < cursor)
+    
+    result = await db.execute(query, {"user_id": user_id, "limit": limit})
     
-    return [UserProfile.model_validate(user) for user in following]
\ No newline at end of file
+    return json_response(request, user_list_encoder.encode(user_list_page(result.all(), limit)))
\ No newline at end of file
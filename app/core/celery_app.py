@@ -5,7 +5,7 @@ celery_app = Celery(
     "photo_social_platform",
     broker=settings.CELERY_BROKER_URL,
     backend=settings.CELERY_RESULT_BACKEND,
-    include=["app.tasks.email_tasks"]
+    include=["app.tasks.email_tasks", "app.tasks.image_tasks"]
 )
 
 # Configure Celery
@@ -29,4 +29,9 @@ celery_app.conf.beat_schedule = {
         'task': 'app.tasks.email_tasks.clean_old_chat_messages',
         'schedule': 86400.0,  # 24 hours in seconds
     },
+    # Keep next month's chat message partition ready ahead of time
+    'create-chat-partitions': {
+        'task': 'app.tasks.email_tasks.create_chat_message_partitions',
+        'schedule': 86400.0,  # 24 hours in seconds
+    },
 }
\ No newline at end of file
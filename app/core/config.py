@@ -1,11 +1,14 @@
 from pydantic_settings import BaseSettings
-from typing import List
-from functools import lru_cache
+from typing import FrozenSet
+from functools import cached_property
 
 
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_RECYCLE: int = 1800  # seconds
     
     # Redis
     REDIS_URL: str
@@ -16,6 +19,15 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
+    # Password hashing (Argon2id, OWASP minimum cost by default)
+    PASSWORD_PEPPER: str = ""
+    # Retry failed logins without the pepper, for hashes stored before it
+    # was set (turn off once those users have logged in again)
+    PASSWORD_PEPPER_LEGACY_FALLBACK: bool = True
+    ARGON2_TIME_COST: int = 2
+    ARGON2_MEMORY_COST: int = 19456  # KiB
+    ARGON2_PARALLELISM: int = 1
+    
     # Email
     SMTP_HOST: str
     SMTP_PORT: int
@@ -24,6 +36,7 @@ class Settings(BaseSettings):
     EMAIL_FROM: str
     EMAIL_FROM_NAME: str = "Photo Social Platform"
     VERIFICATION_CODE_EXPIRE_MINUTES: int = 15
+    EMAIL_STRICT_VALIDATION: bool = True  # Full email-validator check on registration
     
     # Google OAuth
     GOOGLE_CLIENT_ID: str
@@ -40,6 +53,8 @@ class Settings(BaseSettings):
     ALLOWED_IMAGE_EXTENSIONS: str = "jpg,jpeg,png,gif,webp"
     UPLOAD_DIR: str = "uploads/photos"
     PROFILE_UPLOAD_DIR: str = "uploads/profiles"
+    SERVE_UPLOADS: bool = True  # Serve /uploads from the app (off behind nginx / a CDN)
+    UPLOADS_ACCEL_PREFIX: str = ""  # nginx internal location for X-Accel-Redirect downloads
     
     # Image Processing
     IMAGE_QUALITY: int = 85
@@ -67,18 +82,20 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = True
     
-    @property
-    def allowed_origins_list(self) -> List[str]:
-        return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
+    # Parsed once, settings don't change after startup (sets, since they
+    # are only used for membership checks)
+    @cached_property
+    def allowed_origins(self) -> FrozenSet[str]:
+        return frozenset(origin.strip() for origin in self.ALLOWED_ORIGINS.split(","))
     
-    @property
-    def allowed_extensions_list(self) -> List[str]:
-        return [ext.strip() for ext in self.ALLOWED_IMAGE_EXTENSIONS.split(",")]
+    @cached_property
+    def allowed_extensions(self) -> FrozenSet[str]:
+        return frozenset(ext.strip().lower() for ext in self.ALLOWED_IMAGE_EXTENSIONS.split(","))
 
 
-@lru_cache()
-def get_settings() -> Settings:
-    return Settings()
+# The settings instance, import this rather than calling get_settings
+settings = Settings()
 
 
-settings = get_settings()
\ No newline at end of file
+def get_settings() -> Settings:
+    return settings
\ No newline at end of file
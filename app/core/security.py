@@ -1,73 +1,180 @@
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
-from jose import JWTError, jwt
+from typing import Optional, Dict, Any, Tuple
+import jwt
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
+from cachetools import TTLCache
+from fastapi.concurrency import run_in_threadpool
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import hmac
+import os
 import secrets
-import string
+import threading
+import time
 
 from app.core.config import settings
 
 # Argon2 password hasher
-ph = PasswordHasher()
+ph = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM,
+    hash_len=32,
+    salt_len=16
+)
+
+# Dedicated threads for Argon2 so logins can't exhaust the shared threadpool
+# (the C extension releases the GIL while hashing, so threads scale with cores)
+_argon_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="argon2")
+
+# JWT signing key, encoded once rather than on every encode / decode
+_JWT_KEY = settings.SECRET_KEY.encode()
+
+# Verified JWT payloads keyed by token fingerprint
+# (guarded by a lock since decoding may run in the threadpool)
+_JWT_CACHE: TTLCache = TTLCache(maxsize=10000, ttl=30)
+_JWT_CACHE_LOCK = threading.Lock()
 
 
 # Password hashing
+def _pepper(password: str) -> bytes:
+    """HMAC the password with the server-side pepper before hashing"""
+    return hmac.new(settings.PASSWORD_PEPPER.encode(), password.encode(), hashlib.sha256).digest()
+
+
 def hash_password(password: str) -> str:
     """Hash password using Argon2"""
+    if settings.PASSWORD_PEPPER:
+        return ph.hash(_pepper(password))
     return ph.hash(password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password against hash"""
+def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify password against hash
+    Also returns a new hash when the stored one predates the current
+    Argon2 parameters or pepper, so the caller can save it
+    """
     try:
-        ph.verify(hashed_password, plain_password)
-        # Check if rehashing is needed
-        if ph.check_needs_rehash(hashed_password):
-            return True  # Password is valid, but should be rehashed
-        return True
+        if settings.PASSWORD_PEPPER:
+            try:
+                ph.verify(hashed_password, _pepper(plain_password))
+            except VerifyMismatchError:
+                # Hashes stored before the pepper was set (a second Argon2 run
+                # on every wrong password, so only while some may remain)
+                if not settings.PASSWORD_PEPPER_LEGACY_FALLBACK:
+                    raise
+                ph.verify(hashed_password, plain_password)
+                return True, hash_password(plain_password)
+        else:
+            ph.verify(hashed_password, plain_password)
     except VerifyMismatchError:
-        return False
+        return False, None
+    
+    if ph.check_needs_rehash(hashed_password):
+        return True, hash_password(plain_password)
+    return True, None
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash password in the Argon2 pool, keeping it off the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(_argon_pool, hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify password in the Argon2 pool, keeping it off the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(
+        _argon_pool, verify_password, plain_password, hashed_password
+    )
 
 
 # JWT Token functions
 def create_access_token(data: Dict[str, Any]) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
-    # Ensure sub is a string as per JWT standard
+    # Ensure sub is a string as per JWT standard, keep the numeric id in uid
     if "sub" in to_encode:
+        to_encode.setdefault("uid", to_encode["sub"])
         to_encode["sub"] = str(to_encode["sub"])
     expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire, "type": "access"})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, _JWT_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
 def create_refresh_token(data: Dict[str, Any]) -> str:
     """Create JWT refresh token"""
     to_encode = data.copy()
-    # Ensure sub is a string as per JWT standard
+    # Ensure sub is a string as per JWT standard, keep the numeric id in uid
     if "sub" in to_encode:
+        to_encode.setdefault("uid", to_encode["sub"])
         to_encode["sub"] = str(to_encode["sub"])
     expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire, "type": "refresh"})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, _JWT_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
+def token_fingerprint(token: str) -> bytes:
+    """Short digest of a token, used as a cache key"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def get_cached_token_payload(token: str) -> Optional[Dict[str, Any]]:
+    """Get payload of a recently verified token that has not expired since"""
+    key = token_fingerprint(token)
+    with _JWT_CACHE_LOCK:
+        payload = _JWT_CACHE.get(key)
+        if payload is not None and payload["exp"] <= time.time():
+            _JWT_CACHE.pop(key, None)
+            return None
+    return payload
+
+
 def decode_token(token: str) -> Optional[Dict[str, Any]]:
     """Decode and verify JWT token"""
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    payload = get_cached_token_payload(token)
+    if payload is not None:
         return payload
-    except JWTError:
+    
+    try:
+        payload = jwt.decode(token, _JWT_KEY, algorithms=[settings.ALGORITHM])
+    except jwt.InvalidTokenError:
         return None
+    
+    # Only cache tokens that outlive the current time, so a cached entry
+    # can never be served past the token's own expiry
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)) and exp > time.time():
+        with _JWT_CACHE_LOCK:
+            _JWT_CACHE[token_fingerprint(token)] = payload
+    return payload
+
+
+async def decode_token_async(token: str) -> Optional[Dict[str, Any]]:
+    """Decode token, verifying the signature in the threadpool on cache miss"""
+    payload = get_cached_token_payload(token)
+    if payload is not None:
+        return payload
+    return await run_in_threadpool(decode_token, token)
 
 
 # Verification code generation
-def generate_verification_code() -> str:
-    """Generate 6-digit verification code"""
-    return ''.join(secrets.choice(string.digits) for _ in range(6))
+def generate_verification_code() -> int:
+    """Generate 6-digit verification code (stored as an integer)"""
+    return secrets.randbelow(1000000)
+
+
+def format_verification_code(code: int) -> str:
+    """Verification code as shown to the user, zero-padded to 6 digits"""
+    return f"{int(code):06d}"
+
+
+def verification_code_matches(code: int, submitted: str) -> bool:
+    """Compare a stored verification code with a submitted one in constant time"""
+    return hmac.compare_digest(format_verification_code(code).encode(), submitted.encode())
 
 
 def generate_verification_token() -> str:
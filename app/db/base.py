@@ -2,7 +2,7 @@ from app.db.session import Base
 from app.models.user import User, EmailVerification, PasswordReset
 from app.models.photo import Photo, PhotoCategory, PhotoLike, Category
 from app.models.comment import Comment
-from app.models.chat import ChatMessage
+from app.models.chat import ChatMessage, ConversationState
 from app.models.social import Follow, Block
 
 # Import all models here so Alembic can detect them
@@ -17,6 +17,7 @@ __all__ = [
     "Category",
     "Comment",
     "ChatMessage",
+    "ConversationState",
     "Follow",
     "Block",
 ]
\ No newline at end of file
@@ -0,0 +1,66 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import List
+import re
+
+# chat_messages is range partitioned on created_at, one partition per UTC
+# month named chat_messages_YYYY_MM (plus chat_messages_default for rows
+# outside every month, normally empty)
+CHAT_PARTITION_PREFIX = "chat_messages_"
+CHAT_PARTITION_NAME = re.compile(r"^chat_messages_(\d{4})_(\d{2})$")
+
+# Partitions currently attached to chat_messages
+LIST_CHAT_PARTITIONS = text(
+    "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+    "WHERE i.inhparent = 'chat_messages'::regclass"
+)
+
+
+def month_start(moment: datetime) -> datetime:
+    """First instant of the month moment falls in"""
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(month: datetime) -> datetime:
+    """First instant of the month after month"""
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def chat_partition_name(month: datetime) -> str:
+    """Name of the chat_messages partition holding month"""
+    return f"{CHAT_PARTITION_PREFIX}{month:%Y_%m}"
+
+
+async def create_chat_partitions(db: AsyncSession, months_ahead: int = 1) -> None:
+    """Create the partitions for this month and months_ahead more, skipping existing ones"""
+    month = month_start(datetime.utcnow())
+    for _ in range(months_ahead + 1):
+        upper = next_month(month)
+        await db.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{chat_partition_name(month)}" PARTITION OF chat_messages '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') TO ('{upper:%Y-%m-%d} 00:00:00+00')"
+        ))
+        month = upper
+
+
+async def drop_chat_partitions_before(db: AsyncSession, cutoff: datetime) -> List[str]:
+    """
+    Detach and drop the monthly partitions that end at or before cutoff
+    Returns the names of the dropped partitions
+    """
+    result = await db.execute(LIST_CHAT_PARTITIONS)
+    dropped = []
+    
+    for name in result.scalars().all():
+        match = CHAT_PARTITION_NAME.match(name)
+        if match is None:
+            continue
+        
+        month = datetime(int(match[1]), int(match[2]), 1)
+        if next_month(month) <= cutoff:
+            await db.execute(text(f'ALTER TABLE chat_messages DETACH PARTITION "{name}"'))
+            await db.execute(text(f'DROP TABLE "{name}"'))
+            dropped.append(name)
+    
+    return dropped
@@ -1,12 +1,18 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
+import asyncio
 import os
 
 from app.core.config import settings
 from app.services.cache_service import close_redis
+from app.services.chat_service import run_fanout_listener
+from app.utils.image import shutdown_image_pool
+from app.utils.http import GZipMiddleware
 from app.api.v1.api import api_router
+from app.api.v1.endpoints.auth import load_google_metadata
 
 
 @asynccontextmanager
@@ -16,9 +22,23 @@ async def lifespan(app: FastAPI):
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
     os.makedirs(settings.PROFILE_UPLOAD_DIR, exist_ok=True)
     
+    # Startup: Warm OAuth metadata in the background
+    metadata_task = asyncio.create_task(load_google_metadata())
+    
+    # Startup: Deliver chat events published by other workers
+    fanout_task = asyncio.create_task(run_fanout_listener())
+    
+    # Startup: Build the OpenAPI schema before serving, so the first /docs
+    # request doesn't pay for it (skipped in development, where reloads are frequent)
+    if not settings.DEBUG:
+        app.openapi()
+    
     yield
     
-    # Shutdown: Close Redis connection
+    # Shutdown: Stop background tasks, the image pool and close Redis connection
+    metadata_task.cancel()
+    fanout_task.cancel()
+    shutdown_image_pool()
     await close_redis()
 
 
@@ -27,20 +47,26 @@ app = FastAPI(
     title=settings.APP_NAME,
     description="Photo sharing social media platform",
     version="1.0.0",
+    # Endpoints returning dicts or models are rendered with orjson
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.allowed_origins_list,
+    allow_origins=settings.allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Mount static files for uploads
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Compress JSON responses (ETags are computed on the uncompressed body)
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
+# Mount static files for uploads (in production nginx serves them directly)
+if settings.SERVE_UPLOADS:
+    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 # Include API router
 app.include_router(api_router, prefix="/api/v1")
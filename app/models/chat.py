@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.session import Base
@@ -7,7 +7,7 @@ from app.db.session import Base
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     content = Column(Text, nullable=False)
     
     sender_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -17,12 +17,56 @@ class ChatMessage(Base):
     is_deleted_by_sender = Column(Boolean, default=False)
     is_deleted_by_receiver = Column(Boolean, default=False)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    # Part of the primary key, the table is range partitioned on it
+    # (see app/db/partitions.py)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), primary_key=True, index=True)
     read_at = Column(DateTime(timezone=True), nullable=True)
     
     # Relationships
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_messages")
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_messages")
     
+    # Serve per-conversation lookups ordered by time, the second one
+    # regardless of direction for keyset-paginated history
+    __table_args__ = (
+        Index("ix_chat_messages_sender_receiver_created", sender_id, receiver_id, created_at.desc()),
+        Index(
+            "ix_chat_messages_conversation_created",
+            func.least(sender_id, receiver_id),
+            func.greatest(sender_id, receiver_id),
+            created_at.desc(),
+            id.desc(),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    
+    # Fetch server-generated created_at in the INSERT itself (RETURNING)
+    __mapper_args__ = {"eager_defaults": True}
+    
+    def __repr__(self):
+        return f"<ChatMessage from={self.sender_id} to={self.receiver_id}>"
+
+
+# One participant's view of a conversation, kept up to date as messages are
+# sent and read so the inbox never has to count chat_messages
+class ConversationState(Base):
+    __tablename__ = "conversation_states"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    peer_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    
+    # Messages from peer_id that user_id has not read yet
+    unread_count = Column(Integer, nullable=False, default=0, server_default="0")
+    
+    # Latest message either way, with its created_at (together they are the
+    # chat_messages primary key)
+    last_message_id = Column(Integer, nullable=False)
+    last_activity = Column(DateTime(timezone=True), nullable=False)
+    
+    # Serve a user's inbox, most recent conversation first
+    __table_args__ = (
+        Index("ix_conversation_states_user_activity", user_id, last_activity.desc(), last_message_id.desc()),
+    )
+    
     def __repr__(self):
-        return f"<ChatMessage from={self.sender_id} to={self.receiver_id}>"
\ No newline at end of file
+        return f"<ConversationState user={self.user_id} peer={self.peer_id} unread={self.unread_count}>"
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, backref
 from app.db.session import Base
 
 
@@ -11,7 +11,12 @@ class Comment(Base):
     content = Column(Text, nullable=False)
     
     photo_id = Column(Integer, ForeignKey("photos.id", ondelete="CASCADE"), nullable=False)
-    author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    
+    # Copied from the author so comments render without a users join
+    # (kept in sync by the users_sync_comment_author trigger)
+    author_username = Column(String(50), nullable=False)
+    author_profile_picture = Column(String(500), nullable=True)
     
     # For nested comments
     parent_id = Column(Integer, ForeignKey("comments.id", ondelete="CASCADE"), nullable=True)
@@ -20,11 +25,28 @@ class Comment(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
+    # (author and replies raise instead of lazy loading, comment reads use
+    # the denormalized author columns and the recursive tree query)
     photo = relationship("Photo", back_populates="comments")
-    author = relationship("User", back_populates="comments")
+    author = relationship("User", back_populates="comments", lazy="raise")
     
     # Self-referential relationship for nested comments
-    parent = relationship("Comment", remote_side=[id], backref="replies")
+    # (replies of a deleted comment go with the database cascade, unloaded)
+    parent = relationship(
+        "Comment",
+        remote_side=[id],
+        backref=backref("replies", lazy="raise", passive_deletes=True)
+    )
+    
+    # Serve a photo's top-level comments in time order (parent_id IS NULL
+    # matches within the photo) and the walk down reply threads
+    __table_args__ = (
+        Index("ix_comments_photo_parent_created", photo_id, parent_id, created_at),
+        Index("ix_comments_parent_id", parent_id),
+    )
+    
+    # Fetch server-generated timestamps in the INSERT/UPDATE itself (RETURNING)
+    __mapper_args__ = {"eager_defaults": True}
     
     def __repr__(self):
         return f"<Comment id={self.id} by user_id={self.author_id}>"
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Table, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.session import Base
@@ -55,13 +55,25 @@ class Photo(Base):
     
     # Relationships
     owner = relationship("User", back_populates="photos")
+    # Category links, likes and comments are deleted by the database cascade
+    # rather than loaded and deleted one by one
     categories = relationship(
         "Category",
         secondary="photo_categories",
-        back_populates="photos"
+        back_populates="photos",
+        passive_deletes=True
     )
-    likes = relationship("PhotoLike", back_populates="photo", cascade="all, delete-orphan")
-    comments = relationship("Comment", back_populates="photo", cascade="all, delete-orphan")
+    likes = relationship("PhotoLike", back_populates="photo", cascade="all, delete-orphan", passive_deletes=True)
+    comments = relationship("Comment", back_populates="photo", cascade="all, delete-orphan", passive_deletes=True)
+    
+    # Serve the newest-first browse list, overall and per owner
+    __table_args__ = (
+        Index("ix_photos_created", created_at.desc()),
+        Index("ix_photos_owner_created", owner_id, created_at.desc()),
+    )
+    
+    # Fetch server-generated timestamps in the INSERT/UPDATE itself (RETURNING)
+    __mapper_args__ = {"eager_defaults": True}
     
     def __repr__(self):
         return f"<Photo {self.title}>"
@@ -81,6 +93,7 @@ class PhotoLike(Base):
     
     # Ensure a user can only like a photo once
     __table_args__ = (
+        UniqueConstraint('photo_id', 'user_id', name='unique_photo_like'),
         {"schema": None, "extend_existing": True},
     )
     
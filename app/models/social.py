@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.session import Base
@@ -8,17 +8,20 @@ class Follow(Base):
     __tablename__ = "follows"
     
     id = Column(Integer, primary_key=True, index=True)
-    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    followed_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    followed_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     follower = relationship("User", foreign_keys=[follower_id], back_populates="following")
     followed = relationship("User", foreign_keys=[followed_id], back_populates="followers")
     
-    # Ensure a user can only follow another user once
+    # Ensure a user can only follow another user once, and page through
+    # follower / following lists newest first by id
     __table_args__ = (
         UniqueConstraint('follower_id', 'followed_id', name='unique_follow'),
+        Index("ix_follows_followed_recent", followed_id, id),
+        Index("ix_follows_follower_recent", follower_id, id),
     )
     
     def __repr__(self):
@@ -29,17 +32,19 @@ class Block(Base):
     __tablename__ = "blocks"
     
     id = Column(Integer, primary_key=True, index=True)
-    blocker_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    blocked_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    blocker_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    blocked_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     blocker = relationship("User", foreign_keys=[blocker_id], back_populates="blocking")
     blocked = relationship("User", foreign_keys=[blocked_id], back_populates="blocked_by")
     
-    # Ensure a user can only block another user once
+    # Ensure a user can only block another user once (the unique index also
+    # serves blocker lookups), plus the reverse direction
     __table_args__ = (
         UniqueConstraint('blocker_id', 'blocked_id', name='unique_block'),
+        Index("ix_blocks_blocked_blocker", blocked_id, blocker_id),
     )
     
     def __repr__(self):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.session import Base
@@ -13,32 +13,42 @@ class User(Base):
     hashed_password = Column(String(255), nullable=True)  # Nullable for OAuth users
     bio = Column(Text, nullable=True)
     profile_picture = Column(String(500), nullable=True)
+    profile_picture_sizes = Column(JSON, nullable=True)  # {"64x64": path, ...} once generated
     
     is_active = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)
     is_oauth = Column(Boolean, default=False)
     oauth_provider = Column(String(50), nullable=True)  # 'google', etc.
     
+    # Denormalized counters, kept in step by the follow / block / photo endpoints
+    followers_count = Column(Integer, default=0)
+    following_count = Column(Integer, default=0)
+    photos_count = Column(Integer, default=0)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    photos = relationship("Photo", back_populates="owner", cascade="all, delete-orphan")
-    comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan")
-    likes = relationship("PhotoLike", back_populates="user", cascade="all, delete-orphan")
+    # (children go with the database's ON DELETE CASCADE, never loaded just
+    # to be deleted)
+    photos = relationship("Photo", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
+    comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan", passive_deletes=True)
+    likes = relationship("PhotoLike", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
     
     # Following relationships
     following = relationship(
         "Follow",
         foreign_keys="Follow.follower_id",
         back_populates="follower",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
     followers = relationship(
         "Follow",
         foreign_keys="Follow.followed_id",
         back_populates="followed",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
     
     # Blocking relationships
@@ -46,13 +56,15 @@ class User(Base):
         "Block",
         foreign_keys="Block.blocker_id",
         back_populates="blocker",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
     blocked_by = relationship(
         "Block",
         foreign_keys="Block.blocked_id",
         back_populates="blocked",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
     
     # Chat messages
@@ -60,15 +72,20 @@ class User(Base):
         "ChatMessage",
         foreign_keys="ChatMessage.sender_id",
         back_populates="sender",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
     received_messages = relationship(
         "ChatMessage",
         foreign_keys="ChatMessage.receiver_id",
         back_populates="receiver",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
     
+    # Fetch server-generated timestamps in the INSERT/UPDATE itself (RETURNING)
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self):
         return f"<User {self.username}>"
 
@@ -79,11 +96,16 @@ class EmailVerification(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False, index=True)
     email = Column(String(255), nullable=False)
-    code = Column(String(6), nullable=False)
+    code = Column(Integer, nullable=False)  # 6 digits, zero-padded when shown
     is_used = Column(Boolean, default=False)
     expires_at = Column(DateTime(timezone=True), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Find an address's unused codes without scanning used ones
+    __table_args__ = (
+        Index("ix_email_verifications_active_email", email, postgresql_where=is_used == False),
+    )
+    
     def __repr__(self):
         return f"<EmailVerification {self.email}>"
 
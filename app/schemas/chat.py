@@ -1,11 +1,16 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, StringConstraints, ConfigDict
+from typing import Optional, List, Annotated, Literal, Union
 from datetime import datetime
+import msgspec
+
+
+# Message text, stripped and length-checked inside pydantic-core
+MessageContent = Annotated[str, StringConstraints(min_length=1, max_length=5000, strip_whitespace=True)]
 
 
 # Message Send
 class MessageCreate(BaseModel):
-    content: str = Field(..., min_length=1, max_length=5000)
+    content: MessageContent
 
 
 # Message Response
@@ -18,8 +23,7 @@ class MessageResponse(BaseModel):
     created_at: datetime
     read_at: Optional[datetime]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 # Conversation Summary
@@ -31,16 +35,49 @@ class ConversationResponse(BaseModel):
     last_message_time: Optional[datetime]
     unread_count: int
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
+# Message and conversation summary for list responses, encoded with msgspec
+# (same JSON shapes as MessageResponse and ConversationResponse)
+class MessageEntry(msgspec.Struct):
+    id: int
+    content: str
+    sender_id: int
+    receiver_id: int
+    is_read: bool
+    created_at: datetime
+    read_at: Optional[datetime]
+
+
+class ConversationEntry(msgspec.Struct):
+    user_id: int
+    username: str
+    profile_picture: Optional[str]
+    last_message: Optional[str]
+    last_message_time: Optional[datetime]
+    unread_count: int
 
 
 # WebSocket Message Types
-class WSMessage(BaseModel):
-    type: str  # "message", "typing", "read"
-    content: Optional[str] = None
-    receiver_id: Optional[int] = None
-    message_id: Optional[int] = None
+class WSChatMessage(BaseModel):
+    type: Literal["message"]
+    content: MessageContent
+    receiver_id: int
+
+
+class WSTyping(BaseModel):
+    type: Literal["typing"]
+    receiver_id: int
+
+
+class WSRead(BaseModel):
+    type: Literal["read"]
+    message_id: int
+
+
+# Any inbound frame, pydantic-core picks the model from "type" directly
+WSMessage = Annotated[Union[WSChatMessage, WSTyping, WSRead], Field(discriminator="type")]
 
 
 # Message History Request
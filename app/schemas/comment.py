@@ -1,21 +1,26 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, StringConstraints, ConfigDict
+import msgspec
+from typing import Optional, List, Annotated
 from datetime import datetime
 
 
+# Comment text, stripped and length-checked inside pydantic-core
+CommentContent = Annotated[str, StringConstraints(min_length=1, max_length=2000, strip_whitespace=True)]
+
+
 # Comment Create (for new top-level comments)
 class CommentCreate(BaseModel):
-    content: str = Field(..., min_length=1, max_length=2000)
+    content: CommentContent
 
 
 # Reply Create (for replying to existing comments)
 class ReplyCreate(BaseModel):
-    content: str = Field(..., min_length=1, max_length=2000)
+    content: CommentContent
 
 
 # Comment Update
 class CommentUpdate(BaseModel):
-    content: str = Field(..., min_length=1, max_length=2000)
+    content: CommentContent
 
 
 # Comment Response
@@ -31,9 +36,23 @@ class CommentResponse(BaseModel):
     updated_at: Optional[datetime]
     replies: List['CommentResponse'] = []
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 # Needed for nested comments
 CommentResponse.model_rebuild()
+
+
+# Comment tree node for the comment list, encoded with msgspec instead of
+# walking nested Pydantic models (same JSON shape as CommentResponse)
+class CommentNode(msgspec.Struct):
+    id: int
+    content: str
+    photo_id: int
+    author_id: int
+    author_username: str
+    author_profile_picture: Optional[str]
+    parent_id: Optional[int]
+    created_at: datetime
+    updated_at: Optional[datetime]
+    replies: List['CommentNode'] = []
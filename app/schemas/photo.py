@@ -1,6 +1,22 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, BeforeValidator, StringConstraints, ConfigDict
+from typing import Optional, List, Annotated
 from datetime import datetime
+import msgspec
+
+
+def split_id_list(value):
+    """Split comma-separated ids, also accepting the field repeated"""
+    if isinstance(value, str):
+        value = [value]
+    return [part.strip() for item in value for part in item.split(",") if part.strip()]
+
+
+# List of ids sent as "1,2" and/or repeated, validated as ints (422 otherwise)
+IdList = Annotated[List[int], BeforeValidator(split_id_list)]
+
+# Photo text fields, stripped and length-checked inside pydantic-core
+PhotoTitle = Annotated[str, StringConstraints(min_length=1, max_length=255, strip_whitespace=True)]
+PhotoDescription = Annotated[str, StringConstraints(max_length=2000, strip_whitespace=True)]
 
 
 # Category
@@ -10,21 +26,20 @@ class CategoryResponse(BaseModel):
     slug: str
     description: Optional[str]
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 # Photo Create
 class PhotoCreate(BaseModel):
-    title: str = Field(..., min_length=1, max_length=255)
-    description: Optional[str] = Field(None, max_length=2000)
+    title: PhotoTitle
+    description: Optional[PhotoDescription] = None
     category_ids: List[int] = Field(default_factory=list)
 
 
 # Photo Update
 class PhotoUpdate(BaseModel):
-    title: Optional[str] = Field(None, min_length=1, max_length=255)
-    description: Optional[str] = Field(None, max_length=2000)
+    title: Optional[PhotoTitle] = None
+    description: Optional[PhotoDescription] = None
     category_ids: Optional[List[int]] = None
 
 
@@ -47,8 +62,7 @@ class PhotoResponse(BaseModel):
     categories: List[CategoryResponse]
     is_liked: bool = False
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 # Photo List Item (lighter version for lists)
@@ -64,8 +78,22 @@ class PhotoListItem(BaseModel):
     comments_count: int
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
+# Photo list item for list responses, encoded with msgspec
+# (same JSON shape as PhotoListItem)
+class PhotoListEntry(msgspec.Struct):
+    id: int
+    title: str
+    file_path: str
+    width: Optional[int]
+    height: Optional[int]
+    owner_id: int
+    owner_username: str
+    likes_count: int
+    comments_count: int
+    created_at: datetime
 
 
 # Photo Filter
@@ -1,40 +1,68 @@
-from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional
+from pydantic import BaseModel, Field, StringConstraints, AfterValidator, field_validator, ConfigDict
+from typing import Optional, Dict, List, Annotated
 from datetime import datetime
+import email_validator
+import msgspec
+
+from app.core.config import settings
+
+
+def normalize_email(value: str) -> str:
+    """Lowercase the domain part, as email-validator's normalization does"""
+    local, _, domain = value.rpartition("@")
+    return f"{local}@{domain.lower()}"
+
+
+# Email address, shape-checked by a pattern inside pydantic-core
+# (EmailStr ran the pure-Python email-validator parser on every request)
+Email = Annotated[
+    str,
+    StringConstraints(max_length=254, pattern=r"^[^@\s]+@[^@\s]+\.[^@\s]+$"),
+    AfterValidator(normalize_email)
+]
+
+
+# Letters, digits, _ and -, checked by pydantic-core without a Python validator
+Username = Annotated[str, StringConstraints(min_length=3, max_length=50, pattern=r"^[A-Za-z0-9_-]+$")]
 
 
 # User Registration
 class UserRegister(BaseModel):
-    username: str = Field(..., min_length=3, max_length=50)
-    email: EmailStr
+    username: Username
+    email: Email
     password: str = Field(..., min_length=8)
     
-    @validator('username')
-    def username_alphanumeric(cls, v):
-        if not v.replace('_', '').replace('-', '').isalnum():
-            raise ValueError('Username must be alphanumeric (with _ or - allowed)')
-        return v
+    @field_validator('email')
+    @classmethod
+    def email_full_syntax(cls, v):
+        # Full syntax check once, when the address is stored
+        if not settings.EMAIL_STRICT_VALIDATION:
+            return v
+        try:
+            return email_validator.validate_email(v, check_deliverability=False).normalized
+        except email_validator.EmailNotValidError as e:
+            raise ValueError(f'value is not a valid email address: {e}')
 
 
 # Email Verification
 class EmailVerificationRequest(BaseModel):
-    email: EmailStr
+    email: Email
     code: str = Field(..., min_length=6, max_length=6)
 
 
 class ResendVerificationRequest(BaseModel):
-    email: EmailStr
+    email: Email
 
 
 # Login
 class UserLogin(BaseModel):
-    email: EmailStr
+    email: Email
     password: str
 
 
 # Password Reset
 class ForgotPasswordRequest(BaseModel):
-    email: EmailStr
+    email: Email
 
 
 class ResetPasswordRequest(BaseModel):
@@ -44,14 +72,8 @@ class ResetPasswordRequest(BaseModel):
 
 # User Profile Update
 class UserUpdate(BaseModel):
-    username: Optional[str] = Field(None, min_length=3, max_length=50)
+    username: Optional[Username] = None
     bio: Optional[str] = Field(None, max_length=500)
-    
-    @validator('username')
-    def username_alphanumeric(cls, v):
-        if v and not v.replace('_', '').replace('-', '').isalnum():
-            raise ValueError('Username must be alphanumeric (with _ or - allowed)')
-        return v
 
 
 # User Response
@@ -61,12 +83,12 @@ class UserResponse(BaseModel):
     email: str
     bio: Optional[str]
     profile_picture: Optional[str]
+    profile_picture_sizes: Optional[Dict[str, str]] = None
     is_verified: bool
     is_oauth: bool
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 # User Profile (public view)
@@ -75,13 +97,40 @@ class UserProfile(BaseModel):
     username: str
     bio: Optional[str]
     profile_picture: Optional[str]
+    profile_picture_sizes: Optional[Dict[str, str]] = None
     created_at: datetime
     followers_count: int = 0
     following_count: int = 0
     photos_count: int = 0
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
+# Page of a follower / following list
+class UserProfilePage(BaseModel):
+    items: List[UserProfile]
+    next_cursor: Optional[int] = None  # Pass as cursor to get the next page
+    
+    model_config = ConfigDict(frozen=True)
+
+
+# Profile and page for follower / following lists, encoded with msgspec
+# (same JSON shapes as UserProfile and UserProfilePage)
+class UserProfileEntry(msgspec.Struct):
+    id: int
+    username: str
+    bio: Optional[str]
+    profile_picture: Optional[str]
+    profile_picture_sizes: Optional[Dict[str, str]]
+    created_at: datetime
+    followers_count: int
+    following_count: int
+    photos_count: int
+
+
+class UserListPage(msgspec.Struct):
+    items: List[UserProfileEntry]
+    next_cursor: Optional[int]
 
 
 # User with additional info
@@ -89,5 +138,4 @@ class UserWithStats(UserProfile):
     is_following: bool = False
     is_blocked: bool = False
     
-    class Config:
-        from_attributes = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True, frozen=True)
\ No newline at end of file
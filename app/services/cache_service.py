@@ -1,11 +1,28 @@
 import redis.asyncio as redis
-from typing import Optional, Any
+from redis.commands.core import AsyncScript
+from typing import Optional, Any, Iterable, Union
 import json
+import time
+import uuid
 from app.core.config import settings
 
 # Redis client
 redis_client: Optional[redis.Redis] = None
 
+# Sliding-window rate limiter, run atomically in one round trip
+# KEYS[1] = key, ARGV = now_ms, window_ms, limit, member id
+RATE_LIMIT_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1] - ARGV[2])
+local n = redis.call('ZCARD', KEYS[1])
+if n < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[1] .. ':' .. ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+rate_limit_script: Optional[AsyncScript] = None
+
 
 async def get_redis() -> redis.Redis:
     """Get Redis client"""
@@ -48,18 +65,53 @@ async def cache_get(key: str) -> Optional[Any]:
     return None
 
 
-async def cache_delete(key: str):
-    """Delete cache"""
+async def cache_get_raw(key: str) -> Optional[str]:
+    """Get cache value as stored, without JSON decoding"""
+    client = await get_redis()
+    return await client.get(key)
+
+
+async def cache_delete(*keys: str):
+    """Delete cache (one or more keys in a single call)"""
+    client = await get_redis()
+    await client.delete(*keys)
+
+
+async def cache_set_indexed(key: str, value: Union[str, bytes], expire: int, indexes: Iterable[str]):
+    """
+    Set cache like cache_set and record the key in each index set, so it
+    can later be dropped by index (the sets expire along with the entry)
+    """
     client = await get_redis()
-    await client.delete(key)
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.setex(key, expire, value)
+        for index in indexes:
+            pipe.sadd(index, key)
+            pipe.expire(index, expire)
+        await pipe.execute()
+
+
+async def cache_delete_index(index: str):
+    """Delete every key recorded in an index set, and the set itself"""
+    client = await get_redis()
+    keys = await client.smembers(index)
+    await client.unlink(index, *keys)
 
 
 async def cache_delete_pattern(pattern: str):
-    """Delete all keys matching pattern"""
+    """
+    Delete all keys matching pattern
+    Walks the keyspace with SCAN rather than a blocking KEYS, and frees
+    the values in the background with UNLINK
+    """
     client = await get_redis()
-    keys = await client.keys(pattern)
-    if keys:
-        await client.delete(*keys)
+    cursor = 0
+    while True:
+        cursor, keys = await client.scan(cursor=cursor, match=pattern, count=500)
+        if keys:
+            await client.unlink(*keys)
+        if cursor == 0:
+            break
 
 
 # Verification code storage
@@ -109,11 +161,18 @@ async def is_user_online(user_id: int) -> bool:
 # Rate limiting
 async def check_rate_limit(key: str, limit: int = 60, window: int = 60) -> bool:
     """
-    Check rate limit
+    Check rate limit over a sliding window
     Returns True if within limit, False if exceeded
     """
+    global rate_limit_script
     client = await get_redis()
-    current = await client.incr(key)
-    if current == 1:
-        await client.expire(key, window)
-    return current <= limit
\ No newline at end of file
+    if rate_limit_script is None or rate_limit_script.registered_client is not client:
+        # Sent with EVALSHA, loaded into Redis on first use
+        rate_limit_script = client.register_script(RATE_LIMIT_LUA)
+    
+    now_ms = time.time_ns() // 1_000_000
+    allowed = await rate_limit_script(
+        keys=[key],
+        args=[now_ms, window * 1000, limit, uuid.uuid4().hex]
+    )
+    return allowed == 1
@@ -0,0 +1,75 @@
+from fastapi import WebSocket
+from collections import defaultdict
+from typing import Dict, Set, Any
+import asyncio
+import orjson
+
+from app.services.cache_service import get_redis
+
+# Redis channel used to reach sockets held by any worker
+FANOUT_CHANNEL = "chat:fanout"
+
+# WebSocket connections on this worker, several per user (one per device)
+active_connections: Dict[int, Set[WebSocket]] = defaultdict(set)
+
+
+# Connection registry
+def add_connection(user_id: int, websocket: WebSocket):
+    """Register a user's WebSocket on this worker"""
+    active_connections[user_id].add(websocket)
+
+
+def remove_connection(user_id: int, websocket: WebSocket):
+    """Unregister a user's WebSocket"""
+    sockets = active_connections.get(user_id)
+    if sockets is None:
+        return
+    sockets.discard(websocket)
+    if not sockets:
+        del active_connections[user_id]
+
+
+async def send_json(websocket: WebSocket, payload: Dict[str, Any]):
+    """Send payload as a JSON text frame, encoded with orjson"""
+    await websocket.send_text(orjson.dumps(payload).decode())
+
+
+async def send_to_local_user(user_id: int, payload: Dict[str, Any]):
+    """Send payload to every socket the user has open on this worker"""
+    sockets = active_connections.get(user_id)
+    if not sockets:
+        return
+    
+    # Encode once for all of the user's devices
+    text = orjson.dumps(payload).decode()
+    for websocket in list(sockets):
+        try:
+            await websocket.send_text(text)
+        except Exception:
+            remove_connection(user_id, websocket)
+
+
+# Cross-worker fanout
+async def send_to_user(user_id: int, payload: Dict[str, Any]):
+    """Deliver payload to the user's sockets on all workers"""
+    client = await get_redis()
+    await client.publish(FANOUT_CHANNEL, orjson.dumps({"to": user_id, "payload": payload}))
+
+
+async def run_fanout_listener():
+    """Forward published chat events to sockets held by this worker"""
+    while True:
+        try:
+            client = await get_redis()
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(FANOUT_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = orjson.loads(message["data"])
+                    await send_to_local_user(data["to"], data["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Redis went away, resubscribe after a short pause
+            await asyncio.sleep(1)
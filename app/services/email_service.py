@@ -1,9 +1,58 @@
 import aiosmtplib
+import asyncio
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import List, Optional
 from app.core.config import settings
 
+# Messages sent over one SMTP connection before it is renewed
+SMTP_MAX_SENDS_PER_CONNECTION = 100
+
+# SMTP connection reused across sends in a worker process, with the loop
+# it belongs to and the number of messages sent over it
+_smtp: Optional[aiosmtplib.SMTP] = None
+_smtp_loop: Optional[asyncio.AbstractEventLoop] = None
+_smtp_sends = 0
+
+
+async def close_smtp():
+    """Close the shared SMTP connection"""
+    global _smtp
+    smtp, _smtp = _smtp, None
+    if smtp is None or not smtp.is_connected:
+        return
+    if _smtp_loop is not asyncio.get_running_loop():
+        # Opened on another event loop, just drop the socket
+        smtp.close()
+        return
+    try:
+        await smtp.quit()
+    except aiosmtplib.SMTPException:
+        smtp.close()
+
+
+async def get_smtp() -> aiosmtplib.SMTP:
+    """Get the shared SMTP connection, connecting (STARTTLS + login) when needed"""
+    global _smtp, _smtp_loop, _smtp_sends
+    if _smtp is not None and (
+        not _smtp.is_connected
+        or _smtp_loop is not asyncio.get_running_loop()
+        or _smtp_sends >= SMTP_MAX_SENDS_PER_CONNECTION
+    ):
+        await close_smtp()
+    
+    if _smtp is None:
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            username=settings.SMTP_USER,
+            password=settings.SMTP_PASSWORD,
+            start_tls=True,
+        )
+        await smtp.connect()
+        _smtp, _smtp_loop, _smtp_sends = smtp, asyncio.get_running_loop(), 0
+    return _smtp
+
 
 async def send_email(
     to_email: str,
@@ -25,15 +74,18 @@ async def send_email(
     html_part = MIMEText(html_content, "html")
     message.attach(html_part)
     
-    # Send email
-    await aiosmtplib.send(
-        message,
-        hostname=settings.SMTP_HOST,
-        port=settings.SMTP_PORT,
-        username=settings.SMTP_USER,
-        password=settings.SMTP_PASSWORD,
-        start_tls=True,
-    )
+    # Send email over the shared connection, so the TLS handshake and
+    # login are paid once per connection rather than per message
+    global _smtp_sends
+    smtp = await get_smtp()
+    try:
+        await smtp.send_message(message)
+    except aiosmtplib.SMTPServerDisconnected:
+        # The server closed the idle connection, retry once on a fresh one
+        await close_smtp()
+        smtp = await get_smtp()
+        await smtp.send_message(message)
+    _smtp_sends += 1
 
 
 def get_verification_email_html(code: str, username: str) -> str:
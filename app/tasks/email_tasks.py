@@ -1,4 +1,7 @@
 from app.core.celery_app import celery_app
+from celery.signals import worker_process_init
+from app.core.config import settings
+from app.core.security import format_verification_code
 from app.services.email_service import (
     send_email,
     get_verification_email_html,
@@ -6,18 +9,46 @@ from app.services.email_service import (
     get_welcome_email_html
 )
 from datetime import datetime, timedelta
+from typing import Optional
+import aiosmtplib
 import asyncio
 
+# SMTP and network errors, retried with exponential backoff
+SMTP_ERRORS = (aiosmtplib.SMTPException, OSError)
+
+
+# Event loop shared by all tasks of a worker process, so connections opened
+# on it (the SMTP connection, the database pool) outlive a single task
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+@worker_process_init.connect
+def init_worker_loop(**kwargs):
+    """Give each worker process its own event loop"""
+    global _loop
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+
 
 def run_async(coro):
     """Helper to run async functions in Celery"""
-    loop = asyncio.get_event_loop()
-    return loop.run_until_complete(coro)
+    global _loop
+    if _loop is None or _loop.is_closed():
+        # No worker process init (solo pool, direct calls)
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coro)
 
 
-@celery_app.task(name="app.tasks.email_tasks.send_verification_email")
-def send_verification_email(email: str, username: str, code: str):
+@celery_app.task(
+    name="app.tasks.email_tasks.send_verification_email",
+    autoretry_for=SMTP_ERRORS,
+    retry_backoff=True,
+    max_retries=3
+)
+def send_verification_email(email: str, username: str, code: int):
     """Send verification email task"""
+    code = format_verification_code(code)
     html_content = get_verification_email_html(code, username)
     text_content = f"Your verification code is: {code}"
     
@@ -29,7 +60,12 @@ def send_verification_email(email: str, username: str, code: str):
     ))
 
 
-@celery_app.task(name="app.tasks.email_tasks.send_welcome_email")
+@celery_app.task(
+    name="app.tasks.email_tasks.send_welcome_email",
+    autoretry_for=SMTP_ERRORS,
+    retry_backoff=True,
+    max_retries=3
+)
 def send_welcome_email(email: str, username: str):
     """Send welcome email task"""
     html_content = get_welcome_email_html(username)
@@ -41,7 +77,12 @@ def send_welcome_email(email: str, username: str):
     ))
 
 
-@celery_app.task(name="app.tasks.email_tasks.send_password_reset_email")
+@celery_app.task(
+    name="app.tasks.email_tasks.send_password_reset_email",
+    autoretry_for=SMTP_ERRORS,
+    retry_backoff=True,
+    max_retries=3
+)
 def send_password_reset_email(email: str, username: str, reset_link: str):
     """Send password reset email task"""
     html_content = get_password_reset_email_html(reset_link, username)
@@ -60,18 +101,62 @@ def clean_old_chat_messages():
     This task runs daily via Celery Beat
     """
     from app.db.session import AsyncSessionLocal
-    from app.models.chat import ChatMessage
-    from sqlalchemy import delete
-    from app.core.config import settings
+    from app.db.partitions import drop_chat_partitions_before
+    # Every model, so the mappers related to ChatMessage can be configured
+    import app.db.base  # noqa: F401
+    from app.models.chat import ChatMessage, ConversationState
+    from sqlalchemy import delete, update, select, func
     
     async def clean():
         async with AsyncSessionLocal() as db:
             cutoff_date = datetime.utcnow() - timedelta(days=settings.CHAT_MESSAGE_RETENTION_DAYS)
             
+            # Months entirely before the cutoff go with their partition
+            await drop_chat_partitions_before(db, cutoff_date)
+            
+            # Remaining expired rows, in the month the cutoff falls in
             await db.execute(
                 delete(ChatMessage).where(ChatMessage.created_at < cutoff_date)
             )
+            
+            # Conversations with no message left drop out of the inbox
+            await db.execute(
+                delete(ConversationState).where(ConversationState.last_activity < cutoff_date)
+            )
+            
+            # Recount the unread messages of the rest, some may have expired
+            await db.execute(
+                update(ConversationState)
+                .where(ConversationState.unread_count > 0)
+                .values(
+                    unread_count=select(func.count())
+                    .where(
+                        ChatMessage.sender_id == ConversationState.peer_id,
+                        ChatMessage.receiver_id == ConversationState.user_id,
+                        ChatMessage.is_read == False
+                    )
+                    .scalar_subquery()
+                )
+            )
             await db.commit()
     
     run_async(clean())
-    return "Old chat messages cleaned"
\ No newline at end of file
+    return "Old chat messages cleaned"
+
+
+@celery_app.task(name="app.tasks.email_tasks.create_chat_message_partitions")
+def create_chat_message_partitions():
+    """
+    Create chat message partitions for this month and the next
+    This task runs daily via Celery Beat
+    """
+    from app.db.session import AsyncSessionLocal
+    from app.db.partitions import create_chat_partitions
+    
+    async def create():
+        async with AsyncSessionLocal() as db:
+            await create_chat_partitions(db)
+            await db.commit()
+    
+    run_async(create())
+    return "Chat message partitions created"
\ No newline at end of file
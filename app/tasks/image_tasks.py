@@ -0,0 +1,34 @@
+from app.core.celery_app import celery_app
+from app.tasks.email_tasks import run_async
+from app.utils.image import compress_image_file, make_thumbnails, delete_thumbnails
+
+
+@celery_app.task(name="app.tasks.image_tasks.process_profile_picture", acks_late=True)
+def process_profile_picture(user_id: int, filepath: str):
+    """Compress a new profile picture and generate its thumbnails task"""
+    from app.db.session import AsyncSessionLocal
+    # Every model, so the mappers related to User can be configured
+    import app.db.base  # noqa: F401
+    from app.models.user import User
+    from app.services.cache_service import cache_delete
+    from sqlalchemy import update
+    
+    compress_image_file(filepath)
+    sizes = make_thumbnails(filepath)
+    if sizes is None:
+        return
+    
+    async def save_sizes() -> bool:
+        async with AsyncSessionLocal() as db:
+            # Only if the user hasn't uploaded another picture meanwhile
+            result = await db.execute(
+                update(User)
+                .where(User.id == user_id, User.profile_picture == filepath)
+                .values(profile_picture_sizes=sizes)
+            )
+            await db.commit()
+        await cache_delete(f"profile:{user_id}")
+        return result.rowcount > 0
+    
+    if not run_async(save_sizes()):
+        delete_thumbnails(filepath)